@@ -0,0 +1,3 @@
+# Benchmarks for the lane detection pipeline.
+# Run from the root folder of the project, e.g.
+# python -m benchmarks.window_search
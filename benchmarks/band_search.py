@@ -0,0 +1,75 @@
+# Compares the band search of drivingLane.follow_prev_fit with the previous
+# implementation, which extracted all nonzero pixels of the binary image and
+# evaluated both fits for every pixel. Both implementations must select the
+# same pixels.
+#
+# python -m benchmarks.band_search
+import argparse
+import warnings
+import numpy as np
+
+from lanes import drivingLane
+from tracking import laneTracker
+from benchmarks.common import load_warped_edges, time_function, print_times
+from benchmarks.window_search import same_pixels
+
+# search around the previous fit before the band search was introduced.
+# Kept as a reference for the benchmark.
+class maskedDrivingLane(drivingLane):
+    def follow_prev_fit(self, binary_warped, points=None):
+        nonzero = binary_warped.nonzero()
+        nonzeroy = np.array(nonzero[0])
+        nonzerox = np.array(nonzero[1])
+        margin = 80
+        left_fit, right_fit = self.leftline.recent_fit, self.rightline.recent_fit
+        left_lane_inds = ((nonzerox > (left_fit[0]*(nonzeroy**2) + left_fit[1]*nonzeroy + left_fit[2] - margin)) &
+                          (nonzerox < (left_fit[0]*(nonzeroy**2) + left_fit[1]*nonzeroy + left_fit[2] + margin)))
+        right_lane_inds = ((nonzerox > (right_fit[0]*(nonzeroy**2) + right_fit[1]*nonzeroy + right_fit[2] - margin)) &
+                           (nonzerox < (right_fit[0]*(nonzeroy**2) + right_fit[1]*nonzeroy + right_fit[2] + margin)))
+        self.leftline.allx = nonzerox[left_lane_inds]
+        self.leftline.ally = nonzeroy[left_lane_inds]
+        self.rightline.allx = nonzerox[right_lane_inds]
+        self.rightline.ally = nonzeroy[right_lane_inds]
+        if len(self.leftline.allx) != 0:
+            self.leftline.recent_fit = np.polyfit(self.leftline.ally, self.leftline.allx, 2)
+        if len(self.rightline.allx) != 0:
+            self.rightline.recent_fit = np.polyfit(self.rightline.ally, self.rightline.allx, 2)
+
+# returns a lane of the given class, which is seeded with the fits of the
+# sliding window search. The tracker is disabled, so follow_prev_fit searches
+# around the recent fits.
+def seeded_lane(cls, binary, histogram_data):
+    lane = cls()
+    lane.tracker = laneTracker(max_missed=0)
+    lane.find_new_fit(binary, histogram_data)
+    return lane
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the search around the previous fit')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    # the warped test images contain lines with very few pixels
+    warnings.filterwarnings('ignore', message='Polyfit may be poorly conditioned')
+    names, edges = load_warped_edges()
+    speedup = []
+    for name, (binary, histogram_data) in zip(names, edges):
+        masked = seeded_lane(maskedDrivingLane, binary, histogram_data)
+        banded = seeded_lane(drivingLane, binary, histogram_data)
+        if masked.leftline.recent_fit is None or masked.rightline.recent_fit is None:
+            print (name + ' - skipped, no fit found')
+            continue
+        # both implementations refit the selected pixels, so the fits evolve
+        # identically over the repeated calls
+        masked_times = time_function(masked.follow_prev_fit, binary, repeat=args.repeat)
+        banded_times = time_function(banded.follow_prev_fit, binary, repeat=args.repeat)
+        if not same_pixels(masked, banded):
+            raise AssertionError('different pixels selected for ' + name)
+        print (name + ' - nonzero pixels: ' + str(np.count_nonzero(binary)))
+        print_times('  masks (previous)', masked_times)
+        print_times('  band search', banded_times)
+        speedup.append(np.median(masked_times) / np.median(banded_times))
+    print ('Speed up (median over all images): {:0.2f}x'.format(np.median(speedup)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# Checks the tracking of the lines through frames without lane pixels. The
+# pipeline processes a sequence of camera test images with black frames in
+# between. In a black frame follow_prev_fit finds no pixels, so both lines
+# must be missed: the tracker counts the frame as predicted and, after
+# config.max_missed_frames missed frames, the lane is rescanned. The
+# lines are detected again in the following camera frames. The counters of
+# the tracker must add up to the number of frames.
+#
+# python -m benchmarks.blank_frames
+# python -m benchmarks.blank_frames --good 3 --blank 8 --max-missed 5
+import argparse
+import warnings
+import numpy as np
+import matplotlib.image as mpimg
+
+import config
+from main import pipeline, OutputType
+
+test_image_path = 'test_images/test1.jpg'
+
+def check(condition, frame, text):
+    if not condition:
+        raise AssertionError('frame ' + str(frame) + ': ' + text)
+
+def main():
+    parser = argparse.ArgumentParser(description='Check of the tracking through blank frames')
+    parser.add_argument('--good', dest='good', type=int, default=3, help='camera frames before and after the blank frames')
+    parser.add_argument('--blank', dest='blank', type=int, default=8, help='black frames')
+    parser.add_argument('--max-missed', dest='max_missed', type=int, default=config.max_missed_frames)
+    args = parser.parse_args()
+
+    # the sliding window search may fit lines with very few pixels
+    warnings.filterwarnings('ignore', message='Polyfit may be poorly conditioned')
+    config.debug_mode = False
+    config.max_missed_frames = args.max_missed
+    good = mpimg.imread(test_image_path)
+    frames = [good]*args.good + [np.zeros_like(good)]*args.blank + [good]*args.good
+
+    pl = pipeline(OutputType.Final)
+    tracker = pl.track.tracker
+    # number of consecutive blank frames
+    missed = 0
+    for i, frame in enumerate(frames):
+        blank = not frame.any()
+        counters = dict(tracker.counters)
+        tracking = pl.track.is_tracking()
+        pl(frame)
+        lines = (pl.track.leftline, pl.track.rightline)
+        print ('frame {:3d} {:5s}  missed {}  {}'.format(i, 'blank' if blank else 'image', tracker.missed, tracker.counters))
+        if blank:
+            missed += 1
+            check(not any(line.detected or line.recent_fit is not None for line in lines), i,
+                  'a line without pixels is detected')
+            if tracking:
+                check(tracker.counters['predicted'] == counters['predicted'] + 1, i, 'not counted as predicted')
+                if tracker.enabled():
+                    check(tracker.missed == [missed, missed], i, 'missed ' + str(tracker.missed))
+            else:
+                check(tracker.counters['rescans'] == counters['rescans'] + 1, i, 'not counted as rescan')
+            check(pl.track.is_tracking() == (tracker.enabled() and missed < args.max_missed), i,
+                  'tracking must stop after ' + str(args.max_missed) + ' missed frames')
+        else:
+            missed = 0
+    check(all(line.detected for line in lines), len(frames) - 1, 'lines not detected after the blank frames')
+    if tracker.enabled():
+        check(tracker.counters['predicted'] == min(args.blank, args.max_missed), len(frames) - 1,
+              str(tracker.counters['predicted']) + ' predicted frames instead of ' + str(min(args.blank, args.max_missed)))
+    check(sum(tracker.counters.values()) == len(frames), len(frames) - 1,
+          'counters ' + str(tracker.counters) + ' do not add up to ' + str(len(frames)) + ' frames')
+    print ('Lines missed in all blank frames, counters add up to ' + str(len(frames)) + ' frames')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+# Helper functions shared by the benchmarks
+import glob
+import time
+import numpy as np
+import matplotlib.image as mpimg
+
+from thresholds import thresholdedImage
+
+test_images_path = 'test_images/*.jpg'
+warped_images_path = 'test_images/*_warped.jpg'
+
+# Calls func(*args) 'repeat' times and returns the wall time of each call in ms
+def time_function(func, *args, repeat=20):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append((time.perf_counter() - start)*1000)
+    return np.array(times)
+
+# Returns the names and the images (RGB) of the given glob pattern
+def load_images(path=test_images_path):
+    names = sorted(glob.glob(path))
+    return names, [mpimg.imread(name) for name in names]
+
+# Returns the names, the binary thresholded images and the histograms of the
+# warped test images
+def load_warped_edges(path=warped_images_path):
+    names, images = load_images(path)
+    edges = []
+    for image in images:
+        binary = thresholdedImage(image)
+        edges.append(binary.applyThresholds())
+    return names, edges
+
+# prints a table row with the median and 95th percentile of the given times
+def print_times(name, times):
+    print('{:<40s} median {:8.3f} ms   p95 {:8.3f} ms'.format(name, np.median(times), np.percentile(times, 95)))
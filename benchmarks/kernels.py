@@ -0,0 +1,64 @@
+# Compares the compiled kernels of kernels.py with the NumPy implementations
+# of the lane search (config.compiled_kernels False):
+#  - sliding windows: extraction of the nonzero pixels and the window search
+#  - band search    : search around a fit in the binary image
+#  - band points    : search around a fit in already extracted pixels
+# Both must select the same pixels in the same order. The first call of each
+# kernel compiles it (or loads it from the cache) and is not timed.
+#
+# python -m benchmarks.kernels
+import argparse
+import warnings
+import numpy as np
+
+import config
+import kernels
+from lanes import drivingLane, SEARCH_MARGIN
+from benchmarks.common import load_warped_edges, time_function, print_times
+
+# runs func with the compiled kernels switched on or off
+def run(compiled, func, *args):
+    config.compiled_kernels = compiled
+    return func(*args)
+
+def same_arrays(a, b):
+    return len(a) == len(b) and all(np.array_equal(x, y) for x, y in zip(a, b))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the compiled lane search kernels')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    if kernels.numba is None:
+        print ('numba is not installed, the NumPy implementations are used')
+        return
+    # the warped test images contain lines with very few pixels
+    warnings.filterwarnings('ignore', message='Polyfit may be poorly conditioned')
+    names, edges = load_warped_edges()
+    lane = drivingLane()
+    speedups = {'sliding windows': [], 'band search': [], 'band points': []}
+    for name, (binary, histogram_data) in zip(names, edges):
+        lane.find_new_fit(binary, histogram_data)
+        fit = lane.leftline.recent_fit
+        if fit is None:
+            print (name + ' - skipped, no fit found')
+            continue
+        points = binary.nonzero()[::-1]
+        cases = {'sliding windows': (lane.window_search, binary, histogram_data),
+                 'band search': (lane.search_band, binary, fit, SEARCH_MARGIN),
+                 'band points': (lane.search_band_points, points[0], points[1], binary.shape[0], fit, SEARCH_MARGIN)}
+        print (name + ' - nonzero pixels: ' + str(len(points[0])))
+        for case, (func, *func_args) in cases.items():
+            expected = run(False, func, *func_args)
+            if not same_arrays(expected, run(True, func, *func_args)):
+                raise AssertionError('different pixels selected by ' + case + ' for ' + name)
+            numpy_times = time_function(run, False, func, *func_args, repeat=args.repeat)
+            compiled_times = time_function(run, True, func, *func_args, repeat=args.repeat)
+            print_times('  ' + case + ' numpy', numpy_times)
+            print_times('  ' + case + ' compiled', compiled_times)
+            speedups[case].append(np.median(numpy_times) / np.median(compiled_times))
+    for case, speedup in speedups.items():
+        print ('Speed up {} (median over all images): {:0.2f}x'.format(case, np.median(speedup)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Benchmark of the coarse to fine search of new lines (config.pyramid_scale)
+# against the sliding window search on the full resolution. Both include the
+# color thresholds of the warped camera test images. Reported are the times
+# and the mean horizontal distance (px) of the coarse fits and of the refined
+# fits to the fits of the full resolution search. The run fails, if the
+# refined fits differ from the full resolution fits by more than 'tolerance'.
+# The speed up depends on the machine and varies between runs.
+# python -m benchmarks.pyramid_search
+import argparse
+import warnings
+import numpy as np
+import cv2
+
+from benchmarks.common import time_function, load_images, print_times
+from thresholds import thresholdedImage, colorThresholds
+from transforms import perspectiveTransform, birdsEyeTransform
+from calibrations import cameraCalibration
+from polynomials import lanePolynomial
+from lanes import drivingLane
+
+pickle_file_path = 'camera_cal/camera_distortion_pickle.p'
+
+# sliding window search on the full resolution (pyramid_scale 1)
+def full_search(warped, ct):
+    lane = drivingLane()
+    edges, histogram_data = thresholdedImage(warped, ct).applyThresholds()
+    lane.find_new_fit(edges, histogram_data)
+    return lane
+
+# same steps as the pipeline with pyramid_scale > 1
+def pyramid_search(warped, ct, scale):
+    lane = drivingLane()
+    height, width = warped.shape[0], warped.shape[1]
+    coarse = cv2.resize(warped, (width//scale, height//scale), interpolation=cv2.INTER_AREA)
+    coarse_edges, coarse_histogram = thresholdedImage(coarse, ct).applyThresholds()
+    seed_fits = lane.find_coarse_fits(coarse_edges, coarse_histogram, scale)
+    if seed_fits[0] is None or seed_fits[1] is None:
+        return lane, seed_fits
+    binary = thresholdedImage(warped, ct)
+    points = binary.applyThresholdsInCorridor(*lane.search_corridor(height, width, fits=seed_fits))
+    edges, histogram_data = binary.rasterizePoints(points, warped.shape)
+    lane.find_new_fit(edges, histogram_data, points, seed_fits)
+    return lane, seed_fits
+
+# mean horizontal distance of the fits (left, right) to the recent fits of the
+# reference lane, nan if a line is missing
+def fit_distance(fits, reference, height):
+    distances = []
+    for fit, reference_line in zip(fits, (reference.leftline, reference.rightline)):
+        if fit is None or reference_line.recent_fit is None:
+            distances.append(np.nan)
+        else:
+            distances.append(np.mean(np.abs(lanePolynomial(fit).x_values(height) -
+                                            lanePolynomial(reference_line.recent_fit).x_values(height))))
+    return np.mean(distances)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the coarse to fine search')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=20)
+    parser.add_argument('--tolerance', dest='tolerance', type=float, default=0.05, help='accepted line distance (px) of the refined fits')
+    args = parser.parse_args()
+
+    # the sliding window search may fit lines with very few pixels
+    warnings.filterwarnings('ignore', message='Polyfit may be poorly conditioned')
+    bet = birdsEyeTransform(cameraCalibration(pickle_file_path), perspectiveTransform())
+    ct = colorThresholds()
+    names, images = load_images()
+    speedups = {2: [], 4: []}
+    for name, image in zip(names, images):
+        # camera images only, the *_warped.jpg images are already transformed
+        if name.endswith('_warped.jpg'):
+            continue
+        warped = bet.warp(image)[1]
+        print (name)
+        reference = full_search(warped, ct)
+        full_times = time_function(full_search, warped, ct, repeat=args.repeat)
+        print_times('  full resolution', full_times)
+        for scale in speedups:
+            times = time_function(pyramid_search, warped, ct, scale, repeat=args.repeat)
+            lane, seed_fits = pyramid_search(warped, ct, scale)
+            coarse_distance = fit_distance(seed_fits, reference, warped.shape[0])
+            distance = fit_distance((lane.leftline.recent_fit, lane.rightline.recent_fit), reference, warped.shape[0])
+            print_times('  pyramid 1/' + str(scale), times)
+            print ('  {:<38s} line distance coarse {:6.2f} px  refined {:6.2f} px'.format('', coarse_distance, distance))
+            speedups[scale].append(np.median(full_times) / np.median(times))
+            if not distance <= args.tolerance:
+                raise AssertionError('refined fits of ' + name + ' at 1/' + str(scale) + ' differ by ' +
+                                     '{:0.2f} px'.format(distance))
+    for scale in speedups:
+        print ('Speed up 1/{} (median over all images): {:0.2f}x'.format(scale, np.median(speedups[scale])))
+
+if __name__ == '__main__':
+    main()
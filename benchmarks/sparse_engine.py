@@ -0,0 +1,90 @@
+# Compares the transform engine 'sparse' (threshold the camera image, then
+# transform the binary image) with the engine 'remap' (transform the camera
+# image, then threshold it) on the camera test images. Reported per image:
+#  - the lane pixels in the top third and in the whole bird's eye view
+#  - the maximum horizontal distance (px) between the fits of both engines
+#  - the radius of curvature (m) and the vehicle offset (m) of both engines
+#  - the time per frame of the transform and the thresholds (find_edges)
+# The run fails, if the fits of a line differ by more than --fit-tolerance px
+# or the curvatures (1/radius) of a line by more than --curvature-tolerance
+# 1/m. The curvatures of the lines are compared instead of the radius of the
+# lane, which is not defined for straight lines and is the mean of the radii
+# of both lines, i.e. dominated by the straighter line. The engines do not
+# agree exactly: 'sparse' scales the channels with their maximum in the
+# camera image and thresholds the pixels before any interpolation.
+#
+# python -m benchmarks.sparse_engine
+import argparse
+import warnings
+import numpy as np
+
+import config
+from main import pipeline, OutputType
+from polynomials import lanePolynomial
+from benchmarks.common import time_function, load_images, print_times
+
+engines = ('remap', 'sparse')
+
+# runs the pipeline of the engine up to the detection of the lines
+def detect(engine, image):
+    config.transform_engine = engine
+    pl = pipeline(OutputType.Final)
+    lane = pl.detect(image)
+    return pl, lane
+
+def fit_distance(fit, reference_fit, height):
+    if fit is None or reference_fit is None:
+        return np.inf
+    return np.max(np.abs(lanePolynomial(fit).x_values(height) - lanePolynomial(reference_fit).x_values(height)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Accuracy of the sparse transform engine')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=20)
+    parser.add_argument('--fit-tolerance', dest='fit_tolerance', type=float, default=5.)
+    parser.add_argument('--curvature-tolerance', dest='curvature_tolerance', type=float, default=5e-4)
+    args = parser.parse_args()
+
+    # the sliding window search may fit lines with very few pixels
+    warnings.filterwarnings('ignore', message='Polyfit may be poorly conditioned')
+    config.debug_mode = False
+    failures = []
+    times = {engine: [] for engine in engines}
+    names, images = load_images()
+    for name, image in zip(names, images):
+        # camera images only, the *_warped.jpg images are already transformed
+        if name.endswith('_warped.jpg'):
+            continue
+        print (name)
+        results = {}
+        for engine in engines:
+            pl, lane = detect(engine, image)
+            height = pl.edges.shape[0]
+            fits = (lane.leftline.recent_fit, lane.rightline.recent_fit)
+            if fits[0] is None or fits[1] is None:
+                radius, curvatures = np.nan, (np.nan, np.nan)
+            else:
+                radius = lane.get_curve_radius()
+                curvatures = tuple(1/line.calc_curavture(lane.ym_per_pix, lane.xm_per_pix)
+                                   for line in (lane.leftline, lane.rightline))
+            results[engine] = fits, curvatures
+            print ('  {:<7s} pixels top third {:6d}  all {:6d}  radius {:9.1f} m  offset {:6.3f} m'.format(
+                   engine, int(np.count_nonzero(pl.edges[:height//3])), int(np.count_nonzero(pl.edges)),
+                   radius, lane.get_vehicle_pos(image.shape)))
+            # new pipeline, which does not track the lines of the detection
+            pl = pipeline(OutputType.Final)
+            pl.find_edges(image)
+            times[engine].extend(time_function(pl.find_edges, image, repeat=args.repeat))
+        (fits, curvatures), (reference_fits, reference_curvatures) = results['sparse'], results['remap']
+        distance = max(fit_distance(fit, reference_fit, height) for fit, reference_fit in zip(fits, reference_fits))
+        curvature = max(abs(np.array(curvatures) - reference_curvatures))
+        print ('  fit distance {:6.2f} px  curvature difference {:0.2e} 1/m'.format(distance, curvature))
+        if not distance <= args.fit_tolerance or not curvature <= args.curvature_tolerance:
+            failures.append(name)
+    for engine in engines:
+        print_times(engine, times[engine])
+    if failures:
+        raise AssertionError('sparse and remap differ on ' + ', '.join(failures))
+    print ('sparse and remap agree within {:0.1f} px and {:0.1e} 1/m'.format(args.fit_tolerance, args.curvature_tolerance))
+
+if __name__ == '__main__':
+    main()
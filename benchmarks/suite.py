@@ -0,0 +1,199 @@
+# Benchmark suite of the stages of the pipeline and of the whole pipeline.
+# Measured on the camera test images and optionally on a segment of a video:
+#  - undistort      : cameraCalibration.undistort
+#  - warp / unwarp  : perspectiveTransform.warp and unwarp
+#  - remap          : birdsEyeTransform.warp (undistort and warp in one pass)
+#  - thresholds     : thresholdedImage.applyThresholds
+#  - find_new_fit   : drivingLane.find_new_fit (sliding windows)
+#  - follow_prev_fit: drivingLane.follow_prev_fit (search around the fits)
+#  - overlay_lanes  : drivingLane.overlay_lanes and overlay_lanes_on_camera
+#  - pipeline_<mode>: the pipeline per OutputType on the sequence of frames,
+#                     reported as ms per frame and fps
+#  - decode_<backend>, encode_<backend>: reading and writing the frames of the
+#                     video with the video backends (moviepy, opencv)
+# The medians (ms) can be saved as JSON baseline and compared with a later
+# run. The run fails, if a stage is slower than its baseline by more than
+# 'tolerance' percent.
+# python -m benchmarks.suite --save benchmark_baseline.json
+# python -m benchmarks.suite --baseline benchmark_baseline.json --tolerance 15
+# python -m benchmarks.suite --video project_video.mp4 --timeslot 0-2
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+import numpy as np
+
+import config
+from benchmarks.common import time_function, load_images, print_times
+from main import pipeline, OutputType
+from thresholds import thresholdedImage, colorThresholds
+from transforms import perspectiveTransform, birdsEyeTransform
+from calibrations import cameraCalibration
+from lanes import drivingLane
+from tracking import laneTracker
+from videos import video_readers, video_writers, frame_range
+
+pickle_file_path = 'camera_cal/camera_distortion_pickle.p'
+
+# Returns the times (ms) of the stages of all frames
+def benchmark_stages(frames, repeat):
+    cc = cameraCalibration(pickle_file_path)
+    pt = perspectiveTransform()
+    bet = birdsEyeTransform(cc, pt)
+    ct = colorThresholds()
+    times = {}
+    def measure(name, func, *args):
+        # the first call warms up caches and compiled kernels
+        func(*args)
+        times.setdefault(name, []).extend(time_function(func, *args, repeat=repeat))
+
+    for frame in frames:
+        undistorted = cc.undistort(frame)[1]
+        measure('undistort', cc.undistort, frame)
+        measure('warp', pt.warp, undistorted)
+        measure('remap', bet.warp, frame)
+        warped = bet.warp(frame)[1]
+        binary = thresholdedImage(warped, ct)
+        measure('thresholds', binary.applyThresholds)
+        # copy, the thresholds reuse their buffer for the next frame
+        edges, histogram_data = [np.copy(data) for data in binary.applyThresholds()]
+        measure('find_new_fit', lambda: drivingLane().find_new_fit(edges, histogram_data))
+        # lane with the fits of this frame. The tracker is disabled, so
+        # follow_prev_fit searches around the recent fits.
+        lane = drivingLane()
+        lane.tracker = laneTracker(max_missed=0)
+        lane.detect_lines(edges, histogram_data)
+        if lane.leftline.recent_fit is not None and lane.rightline.recent_fit is not None:
+            measure('follow_prev_fit', lane.follow_prev_fit, edges)
+        if lane.leftline.best_fit is not None and lane.rightline.best_fit is not None:
+            measure('overlay_lanes', lane.overlay_lanes, frame, edges)
+            measure('overlay_lanes_on_camera', lane.overlay_lanes_on_camera, frame, pt.Minv)
+            measure('unwarp', pt.unwarp, lane.overlay_lanes(frame, edges))
+    return times
+
+# Returns the times (ms) per frame of the pipeline in every output mode. The
+# frames are processed as a sequence, like the frames of a video.
+def benchmark_pipeline(frames, repeat):
+    times = {}
+    for mode in OutputType:
+        name = 'pipeline_' + str(mode)
+        times[name] = []
+        # warm up the caches and compiled kernels of all paths of the sequence
+        warm_up = pipeline(mode)
+        for frame in frames:
+            warm_up(frame)
+        for i in range(repeat):
+            pl = pipeline(mode)
+            for frame in frames:
+                start = time.perf_counter()
+                pl(frame)
+                times[name].append((time.perf_counter() - start)*1000)
+    return times
+
+def run(label, frames, repeat):
+    print (label + ' - ' + str(len(frames)) + ' frames')
+    results = {}
+    for name, times in list(benchmark_stages(frames, repeat).items()) + \
+                       list(benchmark_pipeline(frames, max(1, repeat//10)).items()):
+        print_times('  ' + name, times)
+        if name.startswith('pipeline_'):
+            print ('  {:<38s} {:8.1f} fps'.format('', 1000/np.mean(times)))
+        results[label + '/' + name] = float(np.median(times))
+    return results
+
+# Measures the decoding and the encoding of the frames of the time slot with
+# every video backend (see videos.py). Returns the decoded frames and the
+# medians (ms per frame).
+def benchmark_video_io(file_name, start, end):
+    print ('video I/O - ' + file_name + ' (' + str(start) + '-' + str(end) + ' s)')
+    results = {}
+    for backend in video_readers:
+        reader = video_readers[backend](file_name)
+        first, last = frame_range(reader, start, end)
+        frames, times = [], []
+        frame_iterator = reader.frames(first, last)
+        while True:
+            begin = time.perf_counter()
+            frame = next(frame_iterator, None)
+            if frame is None:
+                break
+            times.append((time.perf_counter() - begin)*1000)
+            frames.append(np.copy(frame))
+        reader.close()
+        print_times('  decode ' + backend, times)
+        print ('  {:<38s} {:8.1f} fps'.format('', 1000/np.mean(times)))
+        results['video/decode_' + backend] = float(np.median(times))
+    output_dir = tempfile.mkdtemp()
+    for backend in video_writers:
+        writer = video_writers[backend](os.path.join(output_dir, backend + '.mp4'), reader.fps)
+        times = []
+        for frame in frames:
+            begin = time.perf_counter()
+            writer.write(frame)
+            times.append((time.perf_counter() - begin)*1000)
+        # closing flushes the encoder, the time is spread over the frames
+        begin = time.perf_counter()
+        writer.close()
+        times = np.array(times) + (time.perf_counter() - begin)*1000/len(times)
+        print_times('  encode ' + backend, times)
+        print ('  {:<38s} {:8.1f} fps'.format('', 1000/np.mean(times)))
+        results['video/encode_' + backend] = float(np.median(times))
+    shutil.rmtree(output_dir)
+    return frames, results
+
+# Prints the change of every stage against the baseline and returns the stages
+# which are slower by more than 'tolerance' percent
+def compare(results, baseline, tolerance):
+    regressions = []
+    print ('{:<48s} {:>10s} {:>10s} {:>8s}'.format('stage', 'baseline', 'current', 'change'))
+    for name, median in results.items():
+        if name not in baseline:
+            continue
+        change = (median/baseline[name] - 1)*100
+        print ('{:<48s} {:8.3f}ms {:8.3f}ms {:+7.1f}%'.format(name, baseline[name], median, change))
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite of the pipeline')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=20)
+    parser.add_argument('--video', dest='video')
+    parser.add_argument('--timeslot', dest='timeslot', default='0-2')
+    parser.add_argument('--save', dest='save', help='save the medians as JSON baseline')
+    parser.add_argument('--baseline', dest='baseline', help='JSON baseline to compare with')
+    parser.add_argument('--tolerance', dest='tolerance', type=float, default=10., help='accepted slow down in percent')
+    args = parser.parse_args()
+
+    # the sliding window search may fit lines with very few pixels
+    warnings.filterwarnings('ignore', message='Polyfit may be poorly conditioned')
+    config.debug_mode = False
+    # camera images only, the *_warped.jpg images are already transformed
+    names, images = load_images()
+    frames = [image for name, image in zip(names, images) if not name.endswith('_warped.jpg')]
+    results = run('test_images', frames, args.repeat)
+
+    if args.video is not None:
+        start, end = [int(i) for i in args.timeslot.split('-')]
+        frames, io_results = benchmark_video_io(args.video, start, end)
+        results.update(io_results)
+        results.update(run('video', frames, max(1, args.repeat//10)))
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print ('Baseline saved at ' + args.save)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit('Slower than the baseline by more than {:0.1f}%: '.format(args.tolerance) + ', '.join(regressions))
+        print ('No stage slower than the baseline by more than {:0.1f}%'.format(args.tolerance))
+
+if __name__ == '__main__':
+    main()
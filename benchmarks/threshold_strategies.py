@@ -0,0 +1,97 @@
+# Benchmark of the threshold strategies in thresholds.threshold_strategies.
+# Every strategy thresholds the bird's eye view of the test images (and of an
+# optional video segment). The reference is the production strategy 'luv_lab'.
+# Reported per strategy:
+#  - the time per frame in ms
+#  - the agreement of the lane pixels with the reference (intersection over union)
+#  - the median (over all frames) of the mean horizontal distance in px between
+#    the lines fitted by the sliding window search on the strategy and on the
+#    reference
+# python -m benchmarks.threshold_strategies
+# python -m benchmarks.threshold_strategies --video challenge_video.mp4 --timeslot 0-5
+import argparse
+import warnings
+import numpy as np
+from moviepy.editor import VideoFileClip
+
+from benchmarks.common import time_function, load_images, print_times
+from thresholds import thresholdedImage, colorThresholds, threshold_strategies
+from transforms import perspectiveTransform, birdsEyeTransform
+from calibrations import cameraCalibration
+from polynomials import lanePolynomial
+from lanes import drivingLane
+
+pickle_file_path = 'camera_cal/camera_distortion_pickle.p'
+reference = 'luv_lab'
+
+# weighted histogram data of a binary image, as used by the pipeline
+def histogram(binary):
+    binary_image = thresholdedImage(None)
+    binary_image.result = binary
+    return binary_image.getHistogramData()
+
+# Returns the fits of the left and the right line found by the sliding window search
+def window_fits(binary):
+    lane = drivingLane()
+    lane.find_new_fit(binary, histogram(binary))
+    return lane.leftline.recent_fit, lane.rightline.recent_fit
+
+# mean horizontal distance between two fits, or nan if one of the lines is missing
+def fit_distance(fit, reference_fit, height):
+    if fit is None or reference_fit is None:
+        return np.nan
+    return np.mean(np.abs(lanePolynomial(fit).x_values(height) - lanePolynomial(reference_fit).x_values(height)))
+
+def intersection_over_union(binary, reference_binary):
+    union = np.count_nonzero((binary == 1) | (reference_binary == 1))
+    if union == 0:
+        return 1.
+    return np.count_nonzero((binary == 1) & (reference_binary == 1)) / union
+
+def compare_strategies(label, frames, repeat):
+    engine = colorThresholds()
+    times = {name: [] for name in threshold_strategies}
+    ious = {name: [] for name in threshold_strategies}
+    distances = {name: [] for name in threshold_strategies}
+    for warped in frames:
+        binaries = {}
+        for name in threshold_strategies:
+            binary = thresholdedImage(warped, engine, name)
+            times[name].extend(time_function(binary.combinedThresholds, warped, repeat=repeat))
+            # copy, the engine reuses its buffer for the next frame
+            binaries[name] = np.copy(binary.combinedThresholds(warped))
+        reference_fits = window_fits(binaries[reference])
+        height = warped.shape[0]
+        for name in threshold_strategies:
+            ious[name].append(intersection_over_union(binaries[name], binaries[reference]))
+            fits = window_fits(binaries[name])
+            distances[name].append(np.nanmean([fit_distance(fit, reference_fit, height)
+                                               for fit, reference_fit in zip(fits, reference_fits)]))
+    print (label + ' - ' + str(len(frames)) + ' frames')
+    for name in threshold_strategies:
+        print_times('  ' + name, times[name])
+        print ('  {:<38s} pixel IoU {:6.3f}   line distance {:8.2f} px'.format('', np.mean(ious[name]), np.nanmedian(distances[name])))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the threshold strategies')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=10)
+    parser.add_argument('--video', dest='video')
+    parser.add_argument('--timeslot', dest='timeslot', default='0-5')
+    args = parser.parse_args()
+
+    # the sliding window search may fit lines with very few pixels
+    warnings.filterwarnings('ignore', message='Polyfit may be poorly conditioned')
+    bet = birdsEyeTransform(cameraCalibration(pickle_file_path), perspectiveTransform())
+    # camera images only, the *_warped.jpg images are already transformed
+    names, images = load_images()
+    frames = [bet.warp(image)[1] for name, image in zip(names, images) if not name.endswith('_warped.jpg')]
+    compare_strategies('test_images', frames, args.repeat)
+
+    if args.video is not None:
+        start, end = [int(i) for i in args.timeslot.split('-')]
+        clip = VideoFileClip(args.video).subclip(start, end)
+        frames = [bet.warp(frame)[1] for frame in clip.iter_frames()]
+        compare_strategies(args.video + ' (' + args.timeslot + ' s)', frames, 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# Compares the analytic virtual twin of line.prepare_virtual_twin with the
+# previous implementation, which offset 24 sampled points one by one and
+# fitted a polynomial to them. The deviation is measured as the largest
+# difference of both polynomials over the rows of the image.
+#
+# python -m benchmarks.virtual_twin
+import argparse
+import numpy as np
+
+import config
+from lanes import line
+from benchmarks.common import time_function, print_times
+
+# largest accepted deviation in pixels between both implementations
+TOLERANCE = 0.05
+
+# virtual twin before the analytic implementation was introduced.
+# Kept as a reference for the benchmark.
+def sampled_virtual_twin(best_fit, offset, max_l=1):
+    x_points = np.linspace(0, max_l, num=25)
+    y_points = np.poly1d(best_fit)(x_points)
+    x_mid, y_mid, m_mid = [], [], []
+    for i in range(len(x_points)-1):
+        y_mid.append((y_points[i+1]-y_points[i])/2.0+y_points[i])
+        x_mid.append((x_points[i+1]-x_points[i])/2.0+x_points[i])
+        if y_points[i+1] == y_points[i]:
+            m_mid.append(1e8)
+        else:
+            m_mid.append(-(x_points[i+1]-x_points[i])/(y_points[i+1]-y_points[i]))
+    x_mid, y_mid, m_mid = np.array(x_mid), np.array(y_mid), np.array(m_mid)
+    x_new = offset*np.sqrt(1.0/(1+m_mid**2))
+    y_new = np.zeros_like(x_new)
+    for i in range(len(y_mid)):
+        if (m_mid[i] < 0) == (offset >= 0):
+            x_new[i] = x_mid[i]-abs(x_new[i])
+        else:
+            x_new[i] = x_mid[i]+abs(x_new[i])
+        y_new[i] = (y_mid[i]-m_mid[i]*x_mid[i])+m_mid[i]*x_new[i]
+    return np.polyfit(x_new, y_new, len(best_fit)-1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the virtual twin')
+    parser.add_argument('--fits', dest='fits', type=int, default=2000, help='number of random fits')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    # random fits covering the curvatures, slopes and positions of the lane lines
+    rng = np.random.default_rng(0)
+    fits = np.column_stack((rng.uniform(-1e-3, 1e-3, args.fits),
+                            rng.uniform(-1, 1, args.fits),
+                            rng.uniform(200, 1000, args.fits)))
+    offsets = rng.choice([380., -380., 300., -300., 480., -480.], args.fits)
+    ploty = np.arange(config.IMAGE_HEIGHT)
+
+    twin = line('twin')
+    deviations = []
+    for fit, offset in zip(fits, offsets):
+        twin.best_fit = fit
+        analytic = twin.prepare_virtual_twin(offset)
+        sampled = sampled_virtual_twin(fit, offset)
+        deviations.append(np.max(np.abs(np.polyval(analytic, ploty) - np.polyval(sampled, ploty))))
+    print ('Deviation over {:d} rows (pixels): median {:0.2e}, p99 {:0.2e}, max {:0.2e}'.format(
+            config.IMAGE_HEIGHT, np.median(deviations), np.percentile(deviations, 99), np.max(deviations)))
+    if np.max(deviations) > TOLERANCE:
+        raise AssertionError('virtual twin deviates more than ' + str(TOLERANCE) + ' pixels')
+
+    twin.best_fit = np.array([2e-4, -0.1, 500.])
+    print_times('sampled (previous)', time_function(sampled_virtual_twin, twin.best_fit, 380., repeat=args.repeat))
+    print_times('analytic', time_function(twin.prepare_virtual_twin, 380., repeat=args.repeat))
+
+if __name__ == '__main__':
+    main()
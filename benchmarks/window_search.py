@@ -0,0 +1,95 @@
+# Compares the sliding window search of drivingLane.find_new_fit with the
+# previous implementation, which masked all nonzero pixels for every window.
+# Both implementations must select the same pixels.
+# The search is timed twice: including the extraction of the nonzero pixels
+# from the binary image and with precomputed pixels (search only).
+#
+# python -m benchmarks.window_search
+import argparse
+import warnings
+import numpy as np
+
+from lanes import drivingLane
+from benchmarks.common import load_warped_edges, time_function, print_times
+
+# sliding window search before the row index was introduced.
+# Kept as a reference for the benchmark.
+class maskedDrivingLane(drivingLane):
+    def find_new_fit(self, edges, histogram_data, points=None):
+        midpoint = int(histogram_data.shape[0]//2)
+        leftx_base = np.argmax(histogram_data[:midpoint])
+        rightx_base = np.argmax(histogram_data[midpoint:]) + midpoint
+        nwindows = 15
+        window_height = int(edges.shape[0]/nwindows)
+        if points is None:
+            nonzero = edges.nonzero()
+            nonzeroy = np.array(nonzero[0])
+            nonzerox = np.array(nonzero[1])
+        else:
+            nonzerox, nonzeroy = points
+        leftx_current = leftx_base
+        rightx_current = rightx_base
+        margin = 80
+        minpix = 30
+        left_lane_inds = []
+        right_lane_inds = []
+        for window in range(nwindows):
+            win_y_low = edges.shape[0] - (window+1)*window_height
+            win_y_high = edges.shape[0] - window*window_height
+            win_xleft_low = leftx_current - margin
+            win_xleft_high = leftx_current + margin
+            win_xright_low = rightx_current - margin
+            win_xright_high = rightx_current + margin
+            good_left_inds = ((nonzeroy >= win_y_low) & (nonzeroy < win_y_high) & (nonzerox >= win_xleft_low) & (nonzerox < win_xleft_high)).nonzero()[0]
+            good_right_inds = ((nonzeroy >= win_y_low) & (nonzeroy < win_y_high) & (nonzerox >= win_xright_low) & (nonzerox < win_xright_high)).nonzero()[0]
+            left_lane_inds.append(good_left_inds)
+            right_lane_inds.append(good_right_inds)
+            if len(good_left_inds) > minpix:
+                leftx_current = int(np.mean(nonzerox[good_left_inds]))
+            if len(good_right_inds) > minpix:
+                rightx_current = int(np.mean(nonzerox[good_right_inds]))
+        left_lane_inds = np.concatenate(left_lane_inds)
+        right_lane_inds = np.concatenate(right_lane_inds)
+        self.leftline.allx = nonzerox[left_lane_inds]
+        self.leftline.ally = nonzeroy[left_lane_inds]
+        self.rightline.allx = nonzerox[right_lane_inds]
+        self.rightline.ally = nonzeroy[right_lane_inds]
+        if len(self.leftline.allx) != 0:
+            self.leftline.recent_fit = np.polyfit(self.leftline.ally, self.leftline.allx, 2)
+        if len(self.rightline.allx) != 0:
+            self.rightline.recent_fit = np.polyfit(self.rightline.ally, self.rightline.allx, 2)
+
+def same_pixels(a, b):
+    return np.array_equal(a.leftline.allx, b.leftline.allx) and np.array_equal(a.leftline.ally, b.leftline.ally) and \
+           np.array_equal(a.rightline.allx, b.rightline.allx) and np.array_equal(a.rightline.ally, b.rightline.ally)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the sliding window search')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    # the warped test images contain lines with very few pixels
+    warnings.filterwarnings('ignore', message='Polyfit may be poorly conditioned')
+    names, edges = load_warped_edges()
+    speedup_full, speedup_search = [], []
+    for name, (binary, histogram_data) in zip(names, edges):
+        nonzero = binary.nonzero()
+        points = (np.array(nonzero[1]), np.array(nonzero[0]))
+        print (name + ' - nonzero pixels: ' + str(len(points[0])))
+        medians = []
+        for label, args_search in (('full', (binary, histogram_data)), ('search only', (binary, histogram_data, points))):
+            masked = maskedDrivingLane()
+            indexed = drivingLane()
+            masked_times = time_function(masked.find_new_fit, *args_search, repeat=args.repeat)
+            indexed_times = time_function(indexed.find_new_fit, *args_search, repeat=args.repeat)
+            if not same_pixels(masked, indexed):
+                raise AssertionError('different pixels selected for ' + name)
+            print_times('  masks (previous) - ' + label, masked_times)
+            print_times('  row index - ' + label, indexed_times)
+            medians.append(np.median(masked_times) / np.median(indexed_times))
+        speedup_full.append(medians[0])
+        speedup_search.append(medians[1])
+    print ('Speed up (median over all images): full {:0.2f}x, search only {:0.2f}x'.format(np.median(speedup_full), np.median(speedup_search)))
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 # This module holds all the configuration parameters
+import os
 #
 # Parameters for camera calibration
 debug_mode = True   # In this model, additional windows with intermediate stages are displayed
@@ -6,6 +7,94 @@ debug_mode = True   # In this model, additional windows with intermediate stages
                     # can be overridden with the flag --debug 
                     # python main.py <path_to_image> --debug
 
+transform_engine = 'remap' # Engine for the undistortion and the perspective transform
+                            # 'dense' : cv2.undistort followed by cv2.warpPerspective
+                            # 'remap' : single cv2.remap with cached lookup maps
+                            # 'sparse': threshold the camera image and transform only
+                            #           the binary image (single channel, nearest
+                            #           neighbour remap)
+                            # can be overridden with the flag --engine
+                            # python main.py <path_to_video> --engine dense
+
+threshold_strategy = 'luv_lab'  # Thresholds for the lane pixels (see thresholds.threshold_strategies)
+                                # 'luv_lab'  : l channel of Luv OR b channel of Lab
+                                # 'clahe_hsv': CLAHE equalized image with HSV/RGB thresholds
+                                # 'sobel_s'  : sobel gradients OR s channel of HLS
+                                # can be overridden with the flag --threshold
+                                # python main.py <path_to_video> --threshold clahe_hsv
+
+corridor_thresholds = True      # While the lines are tracked, only the corridor around the
+                                # previous fits is thresholded (engines 'dense' and 'remap').
+                                # The full frame is thresholded when the lines are rescanned.
+                                # Only for the per pixel strategies of --threshold ('luv_lab'),
+                                # see thresholds.per_pixel_strategies
+                                # can be disabled with the flag --full-frame
+                                # python main.py <path_to_video> --full-frame
+
+pyramid_scale = 1               # Coarse to fine search of new lines (engines 'dense' and 'remap')
+                                # 1   : sliding windows on the full resolution image
+                                # 2, 4: sliding windows on the image reduced by the scale,
+                                #       refined with the full resolution pixels around the
+                                #       coarse fits
+                                # Only for the per pixel strategies of --threshold ('luv_lab'),
+                                # the others use the sliding windows on the full resolution
+                                # can be overridden with the flag --pyramid
+                                # python main.py <path_to_video> --pyramid 2
+
+max_missed_frames = 5           # Number of consecutive frames, in which a line may be missed
+                                # (no valid fit) before the lanes are rescanned with the
+                                # sliding windows. Meanwhile the lines are searched around
+                                # the fits predicted by the tracker (see tracking.py).
+                                # 0 disables the tracker: every missed line forces a rescan
+                                # can be overridden with the flag --max-missed
+                                # python main.py <path_to_video> --max-missed 0
+
+compiled_kernels = True         # Use the compiled (numba) kernels of kernels.py for the
+                                # sliding window and the band search, if numba is installed.
+                                # Without numba, or with False, the NumPy implementations
+                                # in lanes.py are used. Both select the same pixels.
+                                # can be disabled with the flag --no-jit
+                                # python main.py <path_to_video> --no-jit
+
+profile = False                 # Measure the wall time of the stages of the pipeline per frame
+                                # (undistort, warp, coarse_search, thresholds, detect_lines,
+                                # overlay_lanes, unwarp, blend, header, debug and the whole
+                                # frame). The engine 'remap' undistorts within 'warp'.
+                                # Writes output_images/profile_<name>.csv (p50/p95/p99 per
+                                # stage) and profile_<name>.json (Chrome trace)
+                                # can be enabled with the flag --profile
+                                # python main.py <path_to_video> --profile
+
+video_execution = 'serial'      # Execution of the pipeline on the frames of a video
+                                # 'serial'  : moviepy decodes, processes and encodes frame by frame
+                                # 'threaded': decoder, pipeline and encoder run in separate
+                                #             threads, connected by bounded queues. The frames
+                                #             are processed and written in order.
+                                # 'chunks'  : the frames are split into segments, which are
+                                #             processed by separate processes and concatenated
+                                # can be overridden with the flag --execution
+                                # python main.py <path_to_video> --execution threaded
+video_backend = 'moviepy'       # Reading and writing of the video frames
+                                # 'moviepy': frames are piped from and to ffmpeg processes
+                                # 'opencv' : cv2.VideoCapture and cv2.VideoWriter with
+                                #            preallocated frame buffers
+                                # can be overridden with the flag --backend
+                                # python main.py <path_to_video> --backend opencv
+video_queue_size = 8            # Frames per queue of the 'threaded' execution
+chunk_warm_up = 2.              # Seconds of frames before each segment, which are processed
+                                # without output, so the averaged fits converge before the
+                                # segment starts. flag --warm-up
+
+jobs = os.cpu_count()           # Processes of the 'chunks' execution (one per segment) and of
+                                # the batch mode for images (directory or glob pattern)
+                                # can be overridden with the flag --jobs
+                                # python main.py 'test_images/*.jpg' --jobs 4
+
+overlay_mode = 'camera'     # Rendering of the detected lane on the final frame
+                            # 'warped': draw on a bird's eye canvas and unwarp it
+                            # 'camera': project the lines with Minv and draw them
+                            #           directly on the camera image
+
 IMAGE_WIDTH = 1280
 IMAGE_HEIGHT = 720
 nx = 9                                  # the number of inside corners in x
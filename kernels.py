@@ -0,0 +1,118 @@
+# This module holds compiled kernels for the lane search. They are used by
+# lanes.py, if numba is installed and config.compiled_kernels is set.
+# Otherwise the NumPy implementations in lanes.py are used.
+# Each kernel walks through the pixels once, without the temporary arrays of
+# the NumPy implementation, and selects exactly the same pixels in the same
+# order (see benchmarks/kernels.py for the parity check).
+import numpy as np
+import config
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# True, if the compiled kernels are used
+def enabled():
+    return numba is not None and config.compiled_kernels
+
+if numba is not None:
+    # Returns the x and y coordinates of the nonzero pixels of a binary image
+    # in row major order (like nonzero()) and the position of the first
+    # pixel of each row (see lanes.pixelIndex).
+    @numba.njit(cache=True, nogil=True)
+    def mask_index(binary):
+        height, width = binary.shape
+        row_ptr = np.zeros(height+1, dtype=np.int64)
+        for y in range(height):
+            count = 0
+            for x in range(width):
+                if binary[y, x] != 0:
+                    count += 1
+            row_ptr[y+1] = row_ptr[y] + count
+        nonzerox = np.empty(row_ptr[height], dtype=np.int64)
+        nonzeroy = np.empty(row_ptr[height], dtype=np.int64)
+        i = 0
+        for y in range(height):
+            for x in range(width):
+                if binary[y, x] != 0:
+                    nonzerox[i] = x
+                    nonzeroy[i] = y
+                    i += 1
+        return nonzerox, nonzeroy, row_ptr
+
+    # Sliding window search of drivingLane.window_search on the row index
+    # of the pixels. Returns the indices of the pixels of the left and the
+    # right line and the x centers (left, right) of the windows.
+    @numba.njit(cache=True, nogil=True)
+    def sliding_windows(nonzerox, row_ptr, height, leftx_base, rightx_base, nwindows, window_height, margin, minpix):
+        # windows of a line never overlap, so every pixel is selected at most once per line
+        left_inds = np.empty(len(nonzerox), dtype=np.int64)
+        right_inds = np.empty(len(nonzerox), dtype=np.int64)
+        centers = np.empty((nwindows, 2), dtype=np.int64)
+        left_count, right_count = 0, 0
+        leftx_current, rightx_current = leftx_base, rightx_base
+        for window in range(nwindows):
+            win_y_low = height - (window+1)*window_height
+            win_y_high = height - window*window_height
+            centers[window, 0] = leftx_current
+            centers[window, 1] = rightx_current
+            start = row_ptr[min(max(win_y_low, 0), height)]
+            end = row_ptr[min(max(win_y_high, 0), height)]
+            left_found, right_found = 0, 0
+            left_sum, right_sum = 0, 0
+            for i in range(start, end):
+                x = nonzerox[i]
+                if x >= leftx_current - margin and x < leftx_current + margin:
+                    left_inds[left_count] = i
+                    left_count += 1
+                    left_found += 1
+                    left_sum += x
+                if x >= rightx_current - margin and x < rightx_current + margin:
+                    right_inds[right_count] = i
+                    right_count += 1
+                    right_found += 1
+                    right_sum += x
+            # recenter the next window on the mean position
+            if left_found > minpix:
+                leftx_current = int(left_sum / left_found)
+            if right_found > minpix:
+                rightx_current = int(right_sum / right_found)
+        return left_inds[:left_count], right_inds[:right_count], centers
+
+    # Band search of drivingLane.search_band: pixels of the binary image
+    # within +/- margin (exclusive) of the fit, row by row.
+    @numba.njit(cache=True, nogil=True)
+    def band_search(binary, fit, margin):
+        height, width = binary.shape
+        xs = np.empty(height*2*margin, dtype=np.int64)
+        ys = np.empty(height*2*margin, dtype=np.int64)
+        count = 0
+        for y in range(height):
+            fitx = fit[0]*y**2 + fit[1]*y + fit[2]
+            low = int(np.floor(fitx - margin)) + 1
+            high = fitx + margin
+            for x in range(max(low, 0), min(low + 2*margin, width)):
+                if x < high and binary[y, x] != 0:
+                    xs[count] = x
+                    ys[count] = y
+                    count += 1
+        return xs[:count], ys[:count]
+
+    # Band search of drivingLane.search_band_points on the coordinates of
+    # already extracted pixels
+    @numba.njit(cache=True, nogil=True)
+    def band_search_points(nonzerox, nonzeroy, height, fit, margin):
+        fitx = np.empty(height)
+        for y in range(height):
+            fitx[y] = fit[0]*y**2 + fit[1]*y + fit[2]
+        xs = np.empty(len(nonzerox), dtype=nonzerox.dtype)
+        ys = np.empty(len(nonzeroy), dtype=nonzeroy.dtype)
+        count = 0
+        for i in range(len(nonzerox)):
+            x = fitx[nonzeroy[i]]
+            if nonzerox[i] > x - margin and nonzerox[i] < x + margin:
+                xs[count] = nonzerox[i]
+                ys[count] = nonzeroy[i]
+                count += 1
+        return xs[:count], ys[:count]
@@ -1,12 +1,22 @@
 import numpy as np
 import cv2
 import config
+from polynomials import polyfit_rows, rescale_fit, lanePolynomial
+from tracking import laneTracker
+import kernels
 # class to receive the characteristics of each line detection
 
 #global variables
 SIZE_CURR_FIT_ARRAY = 10
+SEARCH_MARGIN = 80          # +/- margin in px around the previous fits, searched by follow_prev_fit
 
 class line():
+    __slots__ = ('id', 'detected', 'recent_xfitted', 'bestx', 'best_poly', 'fits',
+                 'fit_weights', 'fit_count', 'fit_pos', 'weighted_sum', 'weight_total',
+                 'recent_poly', 'pixels_poly', 'radius_of_curvature', 'line_base_pos',
+                 'diffs', 'px_count', 'color', 'thickness', 'weights', 'ally', 'allx',
+                 'virtual_twin')
+
     def __init__(self, id=""):
         self.id = id
         # was the line detected in the last iteration?
@@ -15,12 +25,23 @@ class line():
         self.recent_xfitted = []
         #x values of the fitted line over the last n iterations
         self.bestx = None
-        #polynomial coefficients averaged over the last n iterations
-        self.best_fit = None
-        #polynomial coefficients for the last n number of runs
-        self.current_fit = []
-        #recent calculated polynomial coefficients
-        self.recent_fit = None
+        #polynomial averaged over the last n iterations (see best_fit)
+        self.best_poly = None
+        #polynomial coefficients for the last n number of runs (ring buffer)
+        self.fits = np.zeros((SIZE_CURR_FIT_ARRAY, 3))
+        #weights of the polynomial coefficients for the average (ring buffer)
+        self.fit_weights = np.zeros(SIZE_CURR_FIT_ARRAY)
+        #number of valid entries in the ring buffer
+        self.fit_count = 0
+        #position of the next entry in the ring buffer
+        self.fit_pos = 0
+        #weighted sum of the fits and sum of the weights in the ring buffer
+        self.weighted_sum = np.zeros(3)
+        self.weight_total = 0.
+        #recent calculated polynomial (see recent_fit)
+        self.recent_poly = None
+        #polynomial of the detected line pixels (allx, ally)
+        self.pixels_poly = None
         #radius of curvature of the line in some units
         self.radius_of_curvature = None
         #distance in meters of vehicle center from the line
@@ -33,8 +54,6 @@ class line():
         self.color = (255, 255, 0)
         #thickness of the line
         self.thickness = 15
-        #weights for average
-        self.ranking = []
         #inverted V weights. The weights would be increasin as the points are
         #detected closer to the mid points
         self.init_weights(config.IMAGE_WIDTH, config.IMAGE_HEIGHT)
@@ -49,70 +68,104 @@ class line():
         self.weights = np.arange(start=0, stop=int(2*ysize)-1, step=(2*ysize/xsize), dtype=np.float)
         self.weights[int(xsize/2):] = self.weights[int(xsize/2)-1::-1]
 
+    #polynomial coefficients averaged over the last n iterations
+    @property
+    def best_fit(self):
+        return None if self.best_poly is None else self.best_poly.fit
+
+    @best_fit.setter
+    def best_fit(self, fit):
+        self.best_poly = None if fit is None else lanePolynomial(fit)
+
+    #recent calculated polynomial coefficients. A valid fit is always
+    #calculated from the current line pixels (allx, ally), so it is kept as
+    #the polynomial of the pixels, even if the fit is rejected later on.
+    @property
+    def recent_fit(self):
+        return None if self.recent_poly is None else self.recent_poly.fit
+
+    @recent_fit.setter
+    def recent_fit(self, fit):
+        self.recent_poly = None if fit is None else lanePolynomial(fit)
+        if self.recent_poly is not None:
+            self.pixels_poly = self.recent_poly
+
     ## calculate the radis of curvature
     def calc_curavture(self, ym_per_pix, xm_per_pix ):
-        ploty = np.linspace(0, (config.IMAGE_HEIGHT)-1, config.IMAGE_HEIGHT)
-        try:
-            #fit a second degree polynomial, which fits the current x and y points
-            fit_cr = np.polyfit((self.ally * ym_per_pix), (self.allx * xm_per_pix), 2)
-            #fit a second degree polynomial, which fits the current x and y points
-            y_eval = np.max(ploty)*ym_per_pix
-
-            self.radius_of_curvature = ((1 + (2*fit_cr[0]*y_eval + fit_cr[1])**2)**1.5)/abs(2*fit_cr[0])
-        except:
+        if self.pixels_poly is None:
             self.radius_of_curvature = 0
+        else:
+            #the fit of the current x and y points is converted from pixels
+            #to meters (cached per fit)
+            self.radius_of_curvature = self.pixels_poly.radius(ym_per_pix, xm_per_pix)
         return self.radius_of_curvature
 
-    #reset the current fits and ranking
+    #reset the current fits and their weights
     def reset_curr_fits(self):
-        self.ranking = []
-        self.current_fit = []
+        self.fit_count = 0
+        self.fit_pos = 0
+        self.weighted_sum[:] = 0.
+        self.weight_total = 0.
         self.virtual_twin = None
 
+    #polynomial coefficients for the last n number of runs (oldest first)
+    @property
+    def current_fit(self):
+        if self.fit_count < SIZE_CURR_FIT_ARRAY:
+            return self.fits[:self.fit_count]
+        return np.roll(self.fits, -self.fit_pos, axis=0)
+
+    #adds a fit with the given weight to the ring buffer. The oldest fit is
+    #replaced once the buffer is full. The weighted sum is updated incrementally
+    #and recalculated once per turn of the buffer to avoid rounding drift.
+    def add_fit(self, fit, weight):
+        if self.fit_count == SIZE_CURR_FIT_ARRAY:
+            self.weighted_sum -= self.fit_weights[self.fit_pos]*self.fits[self.fit_pos]
+            self.weight_total -= self.fit_weights[self.fit_pos]
+        else:
+            self.fit_count += 1
+        self.fits[self.fit_pos] = fit
+        self.fit_weights[self.fit_pos] = weight
+        self.weighted_sum += weight*self.fits[self.fit_pos]
+        self.weight_total += weight
+        self.fit_pos = (self.fit_pos + 1) % SIZE_CURR_FIT_ARRAY
+        if self.fit_pos == 0:
+            self.weighted_sum = np.dot(self.fit_weights, self.fits)
+            self.weight_total = self.fit_weights.sum()
+
+    #weighted average of the fits in the ring buffer
+    def average_fit(self):
+        return self.weighted_sum / self.weight_total
+
     # Calculate a polinomial value in a given point x
     def y_eval(self, fit, x):
         function = np.poly1d(fit)
         return(function(x))
 
+    # Returns the fit of the curve parallel to the best fit at the distance
+    # 'offset' (in pixels, measured along the normal of the best fit).
+    # The parallel curve of x = f(y) is (y - offset*f'/w, f + offset/w) with
+    # w = sqrt(1 + f'^2). Both curves share the slope f' at corresponding points,
+    # and the second derivative of the parallel curve is f''/(1 - offset*f''/w^3).
+    # The returned polynomial is the second order approximation of the parallel
+    # curve at the centre of [0, max_l]. This replaces sampling 25 points,
+    # offsetting them one by one and fitting a polynomial to them. Over the 720
+    # rows of the image, the result deviates less than 0.05 pixels from the
+    # sampled implementation (see benchmarks/virtual_twin.py).
     def prepare_virtual_twin(self, offset , max_l = 1):
-        x_points = np.linspace(0, max_l, num=25) # Reference curve points
-        y_points = self.y_eval(self.best_fit, x_points)
-        x_mid = [] # Mid x points
-        y_mid = [] # Mid Y points
-        m_mid = [] # Mid Slope points
-        # Calculate polints position between given points
-        for i in range(len(x_points)-1):
-            y_mid.append((y_points[i+1]-y_points[i])/2.0+y_points[i])
-            x_mid.append((x_points[i+1]-x_points[i])/2.0+x_points[i])
-            # Slope of perpendicular lines
-            if y_points[i+1] == y_points[i]: #Avoid division by 0
-                m_mid.append(1e8) # A very big number - infinite slope
-            else:
-                m_mid.append(-(x_points[i+1]-x_points[i])/(y_points[i+1]-y_points[i])) # Slope of a perpendicular
-        # Convert arrays into np.arrays
-        x_mid = np.array(x_mid)
-        y_mid = np.array(y_mid)
-        m_mid = np.array(m_mid)
-        # Calculate equidistant points
-        x_new = offset*np.sqrt(1.0/(1+m_mid**2)) # Calculate reference shift dx of the equidistant points
-        y_new = np.zeros_like(x_new) # Create np.array for y_eq
-        if offset >= 0: # x positions of the equidistant depends on direction
-            for i in range(len(y_mid)):
-                if m_mid[i] < 0:
-                    x_new[i] = x_mid[i]-abs(x_new[i])
-                else:
-                    x_new[i] = x_mid[i]+abs(x_new[i])
-                y_new[i] = (y_mid[i]-m_mid[i]*x_mid[i])+m_mid[i]*x_new[i]
-        else:
-            for i in range(len(y_mid)):
-                if m_mid[i] < 0:
-                    x_new[i] = x_mid[i]+abs(x_new[i])
-                else:
-                    x_new[i] = x_mid[i]-abs(x_new[i])
-                y_new[i] = (y_mid[i]-m_mid[i]*x_mid[i])+m_mid[i]*x_new[i]
-        # Fit a polinomial of order which is the same to the given one to the equidistant points
-        new_fit = np.polyfit(x_new, y_new, len(self.best_fit)-1)
-        return new_fit
+        a, b, c = self.best_fit
+        y0 = max_l/2.
+        slope = 2*a*y0 + b
+        w = np.sqrt(1 + slope**2)
+        # point of the parallel curve corresponding to y0
+        y_twin = y0 - offset*slope/w
+        x_twin = a*y0**2 + b*y0 + c + offset/w
+        # half of the second derivative of the parallel curve
+        a_twin = a / (1 - 2*a*offset/w**3)
+        # expand a_twin*(y - y_twin)^2 + slope*(y - y_twin) + x_twin
+        return np.array([a_twin,
+                         slope - 2*a_twin*y_twin,
+                         a_twin*y_twin**2 - slope*y_twin + x_twin])
 
     # This function validates the "recent-fit" which was set by the 'track' object.
     # The line object saves the last n fits. If the incoming fit is deviating too much
@@ -131,23 +184,48 @@ class line():
                 self.detected = False
             else:
                 self.detected = True
-                # All ok. Add to the curent fit
-                self.current_fit.append(self.recent_fit)
-                ## Ranking of the current fit based on the number of detected pixels
-                self.ranking.append(len(self.recent_xfitted))
-                # Limit the array (current_fit and ranking ) limited to 'n'
-                if len(self.current_fit) > SIZE_CURR_FIT_ARRAY: #keep the arrays(
-                    self.current_fit = self.current_fit[len(self.current_fit)-SIZE_CURR_FIT_ARRAY:]
-                    self.ranking = self.ranking[len(self.ranking)-SIZE_CURR_FIT_ARRAY:]
-                #calculate bets fit as a weighted average of the current fits based on ranking matrix
-                self.best_fit = np.average(self.current_fit, axis=0, weights=self.ranking)
+                # All ok. Add to the last 'n' fits. The weight of the fit is
+                # based on the number of detected pixels
+                self.add_fit(self.recent_fit, len(self.recent_xfitted))
+                #calculate bets fit as a weighted average of the last 'n' fits
+                self.best_fit = self.average_fit()
                 self.virtual_twin = self.prepare_virtual_twin(lane_width)
         else:# No suitable fit from the last scan. keep the best fit as the average of the last n run
             self.detected = False
-            if len(self.current_fit) > 0:
-                self.best_fit = np.average(self.current_fit, axis=0, weights=self.ranking)
+            if self.fit_count > 0:
+                self.best_fit = self.average_fit()
                 self.virtual_twin = self.prepare_virtual_twin(lane_width)
 
+# Row sorted (CSR like) index of the nonzero pixels of a binary image.
+# row_ptr[y] is the position of the first pixel of the row y, i.e. the pixels
+# of the rows y0 ... y1-1 are nonzerox[row_ptr[y0]:row_ptr[y1]].
+# A query for a window is therefore a slice and a filter on the x range of
+# the few pixels in the slice, instead of masking all nonzero pixels.
+# The row_ptr of pixels in row major order can be given (see kernels.mask_index).
+class pixelIndex:
+    def __init__(self, nonzerox, nonzeroy, height, row_ptr=None):
+        self.height = height
+        if row_ptr is not None:
+            self.nonzerox, self.nonzeroy, self.row_ptr = nonzerox, nonzeroy, row_ptr
+            return
+        # nonzero() returns the pixels in row major order. Sort only if the
+        # given points are not ordered by row.
+        if len(nonzeroy) > 1 and np.any(nonzeroy[1:] < nonzeroy[:-1]):
+            order = np.argsort(nonzeroy, kind='stable')
+            nonzerox = nonzerox[order]
+            nonzeroy = nonzeroy[order]
+        self.nonzerox = nonzerox
+        self.nonzeroy = nonzeroy
+        self.row_ptr = np.searchsorted(nonzeroy, np.arange(height+1))
+
+    # returns the indices of the pixels within the rows y_low ... y_high-1 and
+    # the columns x_low ... x_high-1
+    def query(self, y_low, y_high, x_low, x_high):
+        start = self.row_ptr[min(max(y_low, 0), self.height)]
+        end = self.row_ptr[min(max(y_high, 0), self.height)]
+        x = self.nonzerox[start:end]
+        return ((x >= x_low) & (x < x_high)).nonzero()[0] + start
+
 class drivingLane:
     def __init__(self) :
         self.leftline = line ('left')
@@ -157,6 +235,8 @@ class drivingLane:
         self.vehicle_pos = 0.
         self.left_window_rects = []
         self.right_window_rects = []
+        # predicts the fits, which are searched in the next frame
+        self.tracker = laneTracker()
         ##From class notes Lesson 8 - Advanced Computer vision - Measuring Curvature -II
         ##"U.S. regulations require a minimum lane width of 12 feet or 3.7 meters,
         ## and the dashed lane lines are 10 feet or 3 meters long each."
@@ -170,6 +250,20 @@ class drivingLane:
     def is_detected(self):
         return self.leftline.detected and self.rightline.detected
 
+    # True, if the next frame follows the previous fits (follow_prev_fit)
+    # instead of a rescan with the sliding windows (find_new_fit)
+    def is_tracking(self):
+        if self.tracker.enabled():
+            return self.tracker.is_tracking()
+        return self.is_detected()
+
+    # fits (left, right), around which follow_prev_fit searches: the fits
+    # predicted by the tracker or the recent fits if it is disabled
+    def search_fits(self):
+        if self.tracker.enabled():
+            return self.tracker.predicted_fits
+        return (self.leftline.recent_fit, self.rightline.recent_fit)
+
     def is_incoming_fit_valid(self):
         return self.leftline.incoming_fit is not None and self.rightline.incoming_fit is not None
 
@@ -184,15 +278,9 @@ class drivingLane:
         ret = True
         if self.leftline.recent_fit is not None and self.rightline.recent_fit is not None:
             widths = np.zeros(3) # calculate widths at top, mid and bottom of the frame (perspective transformed)
-
-            ploty = np.linspace(0, config.IMAGE_WIDTH-1, num=config.IMAGE_WIDTH)# to cover same y-range as image
-            left_fitx = self.leftline.recent_fit[0]*ploty**2 + self.leftline.recent_fit[1]*ploty + self.leftline.recent_fit[2]
-            right_fitx = self.rightline.recent_fit[0]*ploty**2 + self.rightline.recent_fit[1]*ploty + self.rightline.recent_fit[2]
-
-            if left_fitx is not None and right_fitx is not None:
-                widths[0] = abs(right_fitx[0] - left_fitx[0])
-                widths[1] = abs(right_fitx[int(max(ploty)/2)] - left_fitx[int(max(ploty)/2)])
-                widths[2] = abs(right_fitx[int(max(ploty)-1)] - left_fitx[int(max(ploty)-1)])
+            # same rows as the previous evaluation over IMAGE_WIDTH points
+            for i, y in enumerate((0, (config.IMAGE_WIDTH-1)//2, config.IMAGE_WIDTH-2)):
+                widths[i] = abs(self.rightline.recent_poly.x_at(y) - self.leftline.recent_poly.x_at(y))
                 #print (widths)
 
             if max(widths) - min(widths) >= 100 : #TODO - Finetune the thresholds by running the challenge video
@@ -208,8 +296,8 @@ class drivingLane:
         ret = False
         if self.leftline.recent_fit is not None and self.rightline.recent_fit is not None:
             #calculate the intercept of the recent fit for both line
-            left_intercept = self.leftline.recent_fit[0]*config.IMAGE_HEIGHT**2 + self.leftline.recent_fit[1]*config.IMAGE_HEIGHT + self.leftline.recent_fit[2]
-            right_intercept = self.rightline.recent_fit[0]*config.IMAGE_HEIGHT**2 + self.rightline.recent_fit[1]*config.IMAGE_HEIGHT + self.rightline.recent_fit[2]
+            left_intercept = self.leftline.recent_poly.intercept()
+            right_intercept = self.rightline.recent_poly.intercept()
             x_int_diff = abs(right_intercept-left_intercept)
             if x_int_diff > 480 : #(380 + offset of 100)
                 ret = True
@@ -219,8 +307,8 @@ class drivingLane:
         width = 380 #Default value manually measured in Straightline1.jog
         if self.leftline.recent_fit is not None and self.rightline.recent_fit is not None:
             #calculate the intercept of the recent fit for both line
-            left_intercept = self.leftline.recent_fit[0]*config.IMAGE_HEIGHT**2 + self.leftline.recent_fit[1]*config.IMAGE_HEIGHT + self.leftline.recent_fit[2]
-            right_intercept = self.rightline.recent_fit[0]*config.IMAGE_HEIGHT**2 + self.rightline.recent_fit[1]*config.IMAGE_HEIGHT + self.rightline.recent_fit[2]
+            left_intercept = self.leftline.recent_poly.intercept()
+            right_intercept = self.rightline.recent_poly.intercept()
             self.width = abs(right_intercept-left_intercept)
         return self.width
 
@@ -239,8 +327,8 @@ class drivingLane:
         ## https://knowledge.udacity.com/questions/311566
         vehicle_position = image_shape[1]/2
         if self.leftline.best_fit is not None and self.rightline.best_fit is not None:
-            leftline_intercept = self.leftline.best_fit[0]*image_shape[0]**2 + self.leftline.best_fit[1]*image_shape[0] + self.leftline.best_fit[2]
-            rightline_intercept = self.rightline.best_fit[0]*image_shape[0]**2 + self.rightline.best_fit[1]*image_shape[0] + self.rightline.best_fit[2]
+            leftline_intercept = self.leftline.best_poly.intercept(image_shape[0])
+            rightline_intercept = self.rightline.best_poly.intercept(image_shape[0])
             lane_center = (leftline_intercept + rightline_intercept) /2
         else:
             lane_center = 0
@@ -249,13 +337,16 @@ class drivingLane:
 
     #Function that detects potential lane lines from an warped, binary thresholded
     #image.
-    def detect_lines(self, edges, histogram_data):
-        if not self.is_detected():
+    #The x and y coordinates of the edges can be passed as 'points', if
+    #they are already known.
+    def detect_lines(self, edges, histogram_data, points=None, seed_fits=None):
+        rescan = not self.is_tracking()
+        if rescan:
             # attempts the find a set of lines based on "sliding windows method"
-            self.find_new_fit(edges, histogram_data)
+            self.find_new_fit(edges, histogram_data, points, seed_fits)
         else:
             # find the lane around the points detected from the previous function
-            self.follow_prev_fit(edges)
+            self.follow_prev_fit(edges, points)
         # validity check at track level for the recently detected lane
         if not self.areLanesParallel() or self.areLanesTooWide():
             # rejecting the lanes incase they are not plausible
@@ -266,12 +357,53 @@ class drivingLane:
         self.leftline.validate_recent_fit(self.width)
         self.rightline.validate_recent_fit(-self.width)
 
+        # predict the fits of the next frame from the accepted fits
+        self.tracker.update(tuple(line.recent_fit if line.detected else None
+                                  for line in (self.leftline, self.rightline)), rescan)
+
     # Finding a lane based on the sliding windows  method.
     # code taken over from Lesson : Finding the Lines: Sliding Window
     # Chapter 8: Advanced Computer Vision
     # from Udacity Nanodegree program :
     # Minor modifications done for encapsulating the function inside a class
-    def find_new_fit(self, edges, histogram_data):
+    def find_new_fit(self, edges, histogram_data, points=None, seed_fits=None):
+        if seed_fits is None:
+            leftx, lefty, rightx, righty = self.window_search(edges, histogram_data, points)
+        else:
+            # pixels around the fits of a coarse search (see find_coarse_fits)
+            leftx, lefty, rightx, righty = self.seeded_search(edges, points, seed_fits)
+
+        # Fit a second order polynomial to each
+        if len(leftx) != 0:
+            self.leftline.reset_curr_fits()
+            self.leftline.recent_xfitted = leftx
+            self.leftline.allx = leftx
+            self.leftline.ally=lefty
+            self.leftline.recent_fit = polyfit_rows(lefty, leftx, edges.shape[0])
+            self.leftline.detected = True
+        else:
+            self.leftline.recent_fit = None
+            #print ('left lane not found')
+
+        if len(rightx) != 0:
+            self.rightline.reset_curr_fits()
+            self.rightline.recent_xfitted = rightx
+            self.rightline.allx = rightx
+            self.rightline.ally = righty
+            self.rightline.recent_fit = polyfit_rows(righty, rightx, edges.shape[0])
+            self.rightline.detected = True
+        else:
+            self.rightline.recent_fit = None
+            #print ('right lane not found')
+
+        if len(leftx) != 0 and len(rightx) != 0:
+            #both lanes found. Save the widths
+            self.saveLaneWidth()
+
+    # Sliding window search. Returns the x and y coordinates of the pixels of
+    # the left and the right line. With 'scale' > 1, edges is a binary image
+    # reduced by 'scale' and the windows are reduced accordingly.
+    def window_search(self, edges, histogram_data, points=None, scale=1):
         # Find the peak of the left and right halves of the histogram
         # These will be the starting point for the left and right lines
         midpoint = np.int(histogram_data.shape[0]//2)
@@ -284,22 +416,44 @@ class drivingLane:
         # Set height of windows
         window_height = np.int(edges.shape[0]/nwindows)
         # Identify the x and y positions of all nonzero pixels in the image
-        nonzero = edges.nonzero()
-        nonzeroy = np.array(nonzero[0])
-        nonzerox = np.array(nonzero[1])
+        # unless they are already known, and index them by row to limit each
+        # window query to its rows
+        if points is None and kernels.enabled():
+            nonzerox, nonzeroy, row_ptr = kernels.mask_index(edges)
+            index = pixelIndex(nonzerox, nonzeroy, edges.shape[0], row_ptr)
+        else:
+            if points is None:
+                nonzero = edges.nonzero()
+                nonzeroy = np.array(nonzero[0])
+                nonzerox = np.array(nonzero[1])
+            else:
+                nonzerox, nonzeroy = points
+            index = pixelIndex(nonzerox, nonzeroy, edges.shape[0])
+        nonzerox = index.nonzerox
+        nonzeroy = index.nonzeroy
         # Current positions to be updated for each window
         leftx_current = leftx_base
         rightx_current = rightx_base
         # Set the width of the windows +/- margin
-        margin = 80
+        margin = 80//scale
         # Set minimum number of pixels found to recenter window
-        minpix = 30
+        minpix = max(30//scale**2, 1)
         # Create empty lists to receive left and right lane pixel indices
         left_lane_inds = []
         right_lane_inds = []
         # reset the sliding window rects
         self.left_window_rects = []
         self.right_window_rects = []
+        if kernels.enabled():
+            left_lane_inds, right_lane_inds, centers = kernels.sliding_windows(
+                index.nonzerox, index.row_ptr, edges.shape[0], int(leftx_base), int(rightx_base),
+                nwindows, window_height, margin, minpix)
+            for window, (leftx_current, rightx_current) in enumerate(centers):
+                win_y_low = edges.shape[0] - (window+1)*window_height
+                win_y_high = edges.shape[0] - window*window_height
+                self.left_window_rects.append(tuple(scale*int(v) for v in (leftx_current - margin, win_y_low, leftx_current + margin, win_y_high)))
+                self.right_window_rects.append(tuple(scale*int(v) for v in (rightx_current - margin, win_y_low, rightx_current + margin, win_y_high)))
+            return nonzerox[left_lane_inds], nonzeroy[left_lane_inds], nonzerox[right_lane_inds], nonzeroy[right_lane_inds]
         # Step through the windows one by one
         for window in range(nwindows):
             # Identify window boundaries in x and y (and right and left)
@@ -310,11 +464,11 @@ class drivingLane:
             win_xright_low = rightx_current - margin
             win_xright_high = rightx_current + margin
             #saving the window rects for debugg purposes
-            self.left_window_rects.append((win_xleft_low, win_y_low, win_xleft_high, win_y_high))
-            self.right_window_rects.append((win_xright_low, win_y_low, win_xright_high, win_y_high))
+            self.left_window_rects.append(tuple(scale*v for v in (win_xleft_low, win_y_low, win_xleft_high, win_y_high)))
+            self.right_window_rects.append(tuple(scale*v for v in (win_xright_low, win_y_low, win_xright_high, win_y_high)))
             # Identify the nonzero pixels in x and y within the window
-            good_left_inds = ((nonzeroy >= win_y_low) & (nonzeroy < win_y_high) & (nonzerox >= win_xleft_low) & (nonzerox < win_xleft_high)).nonzero()[0]
-            good_right_inds = ((nonzeroy >= win_y_low) & (nonzeroy < win_y_high) & (nonzerox >= win_xright_low) & (nonzerox < win_xright_high)).nonzero()[0]
+            good_left_inds = index.query(win_y_low, win_y_high, win_xleft_low, win_xleft_high)
+            good_right_inds = index.query(win_y_low, win_y_high, win_xright_low, win_xright_high)
             # Append these indices to the lists
             left_lane_inds.append(good_left_inds)
             right_lane_inds.append(good_right_inds)
@@ -329,78 +483,136 @@ class drivingLane:
         right_lane_inds = np.concatenate(right_lane_inds)
 
         # Extract left and right line pixel positions
-        leftx = nonzerox[left_lane_inds]
-        lefty = nonzeroy[left_lane_inds]
-        rightx = nonzerox[right_lane_inds]
-        righty = nonzeroy[right_lane_inds]
-
-        # Fit a second order polynomial to each
-        if len(leftx) != 0:
-            self.leftline.reset_curr_fits()
-            self.leftline.recent_xfitted = leftx
-            self.leftline.allx = leftx
-            self.leftline.ally=lefty
-            self.leftline.recent_fit = np.polyfit(lefty, leftx, 2)
-            self.leftline.detected = True
-        else:
-            self.leftline.recent_fit = None
-            #print ('left lane not found')
-
-        if len(rightx) != 0:
-            self.rightline.reset_curr_fits()
-            self.rightline.recent_xfitted = rightx
-            self.rightline.allx = rightx
-            self.rightline.ally = righty
-            self.rightline.recent_fit = np.polyfit(righty, rightx, 2)
-            self.rightline.detected = True
-        else:
-            self.rightline.recent_fit = None
-            #print ('right lane not found')
+        return nonzerox[left_lane_inds], nonzeroy[left_lane_inds], nonzerox[right_lane_inds], nonzeroy[right_lane_inds]
+
+    # Coarse to fine search: the sliding windows run on a binary image, which
+    # is reduced by 'scale' (e.g. 2 or 4). The fits of the coarse pixels are
+    # returned as fits of the full resolution (None for a missing line). They
+    # are the seed_fits of find_new_fit, which refines them with the full
+    # resolution pixels around them.
+    def find_coarse_fits(self, coarse_edges, coarse_histogram, scale):
+        leftx, lefty, rightx, righty = self.window_search(coarse_edges, coarse_histogram, scale=scale)
+        height = coarse_edges.shape[0]
+        return tuple(rescale_fit(polyfit_rows(y, x, height), scale) if len(x) != 0 else None
+                     for x, y in ((leftx, lefty), (rightx, righty)))
+
+    # Returns the pixels within +/- SEARCH_MARGIN of the seed fits. Like
+    # window_search, but the windows follow the given fits.
+    def seeded_search(self, edges, points, seed_fits):
+        self.left_window_rects = []
+        self.right_window_rects = []
+        if points is None:
+            nonzero = edges.nonzero()
+            points = (np.array(nonzero[1]), np.array(nonzero[0]))
+        nonzerox, nonzeroy = points
+        pixels = []
+        for fit in seed_fits:
+            if fit is None:
+                pixels += [nonzerox[:0], nonzeroy[:0]]
+            else:
+                pixels += self.search_band_points(nonzerox, nonzeroy, edges.shape[0], fit, SEARCH_MARGIN)
+        return pixels
 
-        if len(leftx) != 0 and len(rightx) != 0:
-            #both lanes found. Save the widths
-            self.saveLaneWidth()
     # Tracking a line based on the previous selected fit.
     # code taken over from Lesson : Finding the Lines: Search from Prior
     # Chapter 8: Advanced Computer Vision
     # Minor modifications done for encapsulating the function inside a class
-    def follow_prev_fit(self,binary_warped):
+    def follow_prev_fit(self,binary_warped, points=None):
         # reset the sliding window rects
         self.left_window_rects = []
         self.right_window_rects = []
 
-        nonzero = binary_warped.nonzero()
-        nonzeroy = np.array(nonzero[0])
-        nonzerox = np.array(nonzero[1])
+        margin = SEARCH_MARGIN
 
-        margin = 80
-
-        left_lane_inds = ((nonzerox > (self.leftline.recent_fit[0]*(nonzeroy**2) + self.leftline.recent_fit[1]*nonzeroy + self.leftline.recent_fit[2] - margin)) &
-                          (nonzerox < (self.leftline.recent_fit[0]*(nonzeroy**2) + self.leftline.recent_fit[1]*nonzeroy + self.leftline.recent_fit[2] + margin)))
-        right_lane_inds = ((nonzerox > (self.rightline.recent_fit[0]*(nonzeroy**2) + self.rightline.recent_fit[1]*nonzeroy + self.rightline.recent_fit[2] - margin)) &
-                           (nonzerox < (self.rightline.recent_fit[0]*(nonzeroy**2) + self.rightline.recent_fit[1]*nonzeroy + self.rightline.recent_fit[2] + margin)))
-
-        # Again, extract left and right line pixel positions
-        leftx = nonzerox[left_lane_inds]
-        lefty = nonzeroy[left_lane_inds]
-        rightx = nonzerox[right_lane_inds]
-        righty = nonzeroy[right_lane_inds]
+        # Extract left and right line pixel positions within the margin
+        # around the previous (or predicted) fits
+        left_fit, right_fit = self.search_fits()
+        if points is None:
+            leftx, lefty = self.search_band(binary_warped, left_fit, margin)
+            rightx, righty = self.search_band(binary_warped, right_fit, margin)
+        else:
+            nonzerox, nonzeroy = points
+            leftx, lefty = self.search_band_points(nonzerox, nonzeroy, binary_warped.shape[0], left_fit, margin)
+            rightx, righty = self.search_band_points(nonzerox, nonzeroy, binary_warped.shape[0], right_fit, margin)
 
         if len(leftx) != 0:
             # Fit a second order polynomial to each
             self.leftline.recent_xfitted = leftx
             self.leftline.ally = lefty
             self.leftline.allx = leftx
-            self.leftline.recent_fit = np.polyfit(lefty, leftx, 2)
+            self.leftline.recent_fit = polyfit_rows(lefty, leftx, binary_warped.shape[0])
+        else:
+            # no pixels around the fit. The line is missed in this frame and
+            # the tracker predicts it (or a rescan follows).
+            self.leftline.recent_fit = None
+            self.leftline.detected = False
         if len(rightx) != 0:
             self.rightline.recent_xfitted = rightx
             self.rightline.ally = righty
             self.rightline.allx = rightx
-            self.rightline.recent_fit = np.polyfit(righty, rightx, 2)
+            self.rightline.recent_fit = polyfit_rows(righty, rightx, binary_warped.shape[0])
+        else:
+            self.rightline.recent_fit = None
+            self.rightline.detected = False
         if len(leftx) != 0 and len(rightx) != 0:
             #both lanes found. Save the widths
             self.saveLaneWidth()
 
+    # Returns the x and y coordinates of the pixels of the binary image which
+    # are within +/- margin (exclusive) of the fit. The fit is evaluated once
+    # per row and only the band of 2*margin columns around it is read from
+    # each row, so the nonzero pixels of the whole image are never extracted.
+    # The pixels are returned in the same (row major) order as nonzero().
+    def search_band(self, binary_warped, fit, margin):
+        if kernels.enabled():
+            return kernels.band_search(binary_warped, np.asarray(fit, dtype=np.float64), margin)
+        height, width = binary_warped.shape[0], binary_warped.shape[1]
+        cols, valid = self.band_columns(fit, height, width, margin)
+        band = binary_warped[np.arange(height)[:, None], np.clip(cols, 0, width-1)]
+        rows, offsets = ((band != 0) & valid).nonzero()
+        return cols[rows, offsets], rows
+
+    # Returns the columns (height x 2*margin) of the band within +/- margin
+    # (exclusive) of the fit for every row, and the mask of the columns which
+    # are inside the image and inside the band.
+    def band_columns(self, fit, height, width, margin):
+        ploty = np.arange(height)
+        fitx = fit[0]*ploty**2 + fit[1]*ploty + fit[2]
+        # first column of each row, which is greater than fitx - margin
+        low = np.floor(fitx - margin).astype(np.int64) + 1
+        cols = low[:, None] + np.arange(2*margin)
+        valid = (cols >= 0) & (cols < width) & (cols < (fitx + margin)[:, None])
+        return cols, valid
+
+    # Returns the corridor which is searched by follow_prev_fit: the band
+    # columns around the searched fits of both lines side by side
+    # (height x 4*margin) and their mask (see band_columns). Columns of the
+    # right band which are also in the left band are masked out, so every
+    # pixel of the corridor is valid only once.
+    # Instead of the searched fits (see search_fits), other 'fits' (left,
+    # right) can be given.
+    def search_corridor(self, height, width, margin=SEARCH_MARGIN, fits=None):
+        if fits is None:
+            fits = self.search_fits()
+        left_cols, left_valid = self.band_columns(fits[0], height, width, margin)
+        right_cols, right_valid = self.band_columns(fits[1], height, width, margin)
+        offsets = right_cols - left_cols[:, :1]
+        in_left = (offsets >= 0) & (offsets < 2*margin)
+        in_left[in_left] = left_valid[np.nonzero(in_left)[0], offsets[in_left]]
+        right_valid &= ~in_left
+        return np.hstack((left_cols, right_cols)), np.hstack((left_valid, right_valid))
+
+    # Same as search_band for already extracted pixel coordinates. The fit is
+    # evaluated once per row and looked up for every pixel.
+    def search_band_points(self, nonzerox, nonzeroy, height, fit, margin):
+        if kernels.enabled():
+            return kernels.band_search_points(nonzerox, nonzeroy, height, np.asarray(fit, dtype=np.float64), margin)
+        ploty = np.arange(height)
+        fitx = fit[0]*ploty**2 + fit[1]*ploty + fit[2]
+        x = fitx[nonzeroy]
+        inds = (nonzerox > x - margin) & (nonzerox < x + margin)
+        return nonzerox[inds], nonzeroy[inds]
+
     def overlay_lanes(self, original, overlay):
         #new_img = np.copy(original_img)
         if self.leftline.best_fit is None or self.rightline.best_fit is None:
@@ -411,8 +623,8 @@ class drivingLane:
         color_warp = np.dstack((warp_zero, warp_zero, warp_zero))
 
         ploty = np.linspace(0, overlay.shape[0]-1, num=overlay.shape[0])# to cover same y-range as image
-        left_fitx = self.leftline.best_fit[0]*ploty**2 + self.leftline.best_fit[1]*ploty + self.leftline.best_fit[2]
-        right_fitx = self.rightline.best_fit[0]*ploty**2 + self.rightline.best_fit[1]*ploty + self.rightline.best_fit[2]
+        left_fitx = self.leftline.best_poly.x_values(overlay.shape[0])
+        right_fitx = self.rightline.best_poly.x_values(overlay.shape[0])
 
         # Recast the x and y points into usable format for cv2.fillPoly()
         pts_left = np.array([np.transpose(np.vstack([left_fitx, ploty]))])
@@ -428,3 +640,109 @@ class drivingLane:
         cv2.polylines(color_warp, np.int32([pts_right]), isClosed=False, color=self.rightline.color, thickness=self.rightline.thickness)
 
         return color_warp
+
+    # Draws the lane directly on the camera image. Instead of drawing on a
+    # full size bird's eye canvas and unwarping it, the lane and the lines are
+    # projected with the inverse perspective transform Minv and drawn in the
+    # bounding box of the lane. The lines are drawn as bands of their
+    # thickness in the bird's eye view, so they get thinner with the distance
+    # like the unwarped lines. The line pixels are looked up with the inverse
+    # mapping of every pixel of the bounding box, like the unwarp does.
+    # Drawing and blending is limited to the bounding box of the lane.
+    def overlay_lanes_on_camera(self, original, Minv):
+        result = np.copy(original)
+        if self.leftline.best_fit is None or self.rightline.best_fit is None:
+            print('overlay_lanes - receiving empty fits..')
+            return result
+        height, width = original.shape[0], original.shape[1]
+
+        ploty = np.linspace(0, height-1, num=height)# to cover same y-range as image
+        left_fitx = self.leftline.best_poly.x_values(height)
+        right_fitx = self.rightline.best_poly.x_values(height)
+
+        # project the lane and the bands of the lines to the camera image
+        pts_left = np.array([np.transpose(np.vstack([left_fitx, ploty]))])
+        pts_right = np.array([np.flipud(np.transpose(np.vstack([right_fitx, ploty])))])
+        pts = cv2.perspectiveTransform(np.hstack((pts_left, pts_right)), Minv)
+        bands = [cv2.perspectiveTransform(self.line_band(line, ploty), Minv) for line in (self.leftline, self.rightline)]
+        # corners of the bird's eye bounding box of the line pixels
+        allx = np.concatenate((self.leftline.allx, self.rightline.allx))
+        ally = np.concatenate((self.leftline.ally, self.rightline.ally))
+        corners = np.float64([[(allx.min(), ally.min()), (allx.max()+1, ally.min()),
+                               (allx.max()+1, ally.max()+1), (allx.min(), ally.max()+1)]]) if len(allx) else np.zeros((1, 0, 2))
+        corners = cv2.perspectiveTransform(corners, Minv) if len(allx) else corners
+
+        # bounding box of everything which is drawn, clipped to the image
+        x, y, w, h = cv2.boundingRect(np.float32(np.hstack([pts, corners] + bands)[0]))
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x+w, width), min(y+h, height)
+        if x1 <= x0 or y1 <= y0:
+            return result
+        offset = np.array([x0, y0])
+
+        # line pixels of the bounding box: the bird's eye pixel of every pixel
+        # of the box is looked up (1 left line, 2 right line)
+        labels = np.zeros((height, width), dtype=np.uint8)
+        labels[self.leftline.ally, self.leftline.allx] = 1
+        labels[self.rightline.ally, self.rightline.allx] = 2
+        shift = np.array([[1., 0., -x0], [0., 1., -y0], [0., 0., 1.]])
+        box_labels = cv2.warpPerspective(labels, np.dot(shift, Minv), (x1-x0, y1-y0), flags=cv2.INTER_NEAREST)
+
+        # Create an image of the size of the bounding box to draw the lines on
+        color_box = np.zeros((y1-y0, x1-x0, 3), dtype=np.uint8)
+        color_box[box_labels == 1] = [255, 0, 0]
+        color_box[box_labels == 2] = [0, 0, 255]
+        cv2.fillPoly(color_box, np.int_([pts - offset]), (0,255, 0))
+        for band, line in zip(bands, (self.leftline, self.rightline)):
+            cv2.fillPoly(color_box, np.int_([band - offset]), line.color)
+
+        # Combine the lane with the camera image inside the bounding box
+        result[y0:y1, x0:x1] = cv2.addWeighted(result[y0:y1, x0:x1], 1, color_box, 0.5, 0)
+        return result
+
+    # Returns the outline of the band of the thickness of the line around its
+    # best fit in the bird's eye view. The edges are offset along the normal
+    # of the curve, like the edges of a thick polyline.
+    def line_band(self, line, ploty):
+        fitx = line.best_poly.x_values(len(ploty))
+        slope = 2*line.best_fit[0]*ploty + line.best_fit[1]
+        norm = np.sqrt(1 + slope**2)
+        dx, dy = line.thickness/2/norm, -line.thickness/2*slope/norm
+        edge_left = np.transpose(np.vstack([fitx - dx, ploty - dy]))
+        edge_right = np.transpose(np.vstack([fitx + dx, ploty + dy]))
+        return np.array([np.vstack((edge_left, np.flipud(edge_right)))])
+        height, width = original.shape[0], original.shape[1]
+
+        ploty = np.linspace(0, height-1, num=height)# to cover same y-range as image
+        left_fitx = self.leftline.best_poly.x_values(height)
+        right_fitx = self.rightline.best_poly.x_values(height)
+
+        # project the lines and the line pixels to the camera image
+        pts_left = cv2.perspectiveTransform(np.array([np.transpose(np.vstack([left_fitx, ploty]))]), Minv)
+        pts_right = cv2.perspectiveTransform(np.array([np.flipud(np.transpose(np.vstack([right_fitx, ploty])))]), Minv)
+        pts = np.hstack((pts_left, pts_right))
+        px_left = cv2.perspectiveTransform(np.float64([np.transpose(np.vstack([self.leftline.allx, self.leftline.ally]))]), Minv)
+        px_right = cv2.perspectiveTransform(np.float64([np.transpose(np.vstack([self.rightline.allx, self.rightline.ally]))]), Minv)
+
+        # bounding box of everything which is drawn, clipped to the image
+        thickness = max(self.leftline.thickness, self.rightline.thickness)
+        x, y, w, h = cv2.boundingRect(np.int32(np.hstack((pts, px_left, px_right))[0]))
+        x0, y0 = max(x-thickness, 0), max(y-thickness, 0)
+        x1, y1 = min(x+w+thickness, width), min(y+h+thickness, height)
+        if x1 <= x0 or y1 <= y0:
+            return result
+        offset = np.array([x0, y0])
+
+        # Create an image of the size of the bounding box to draw the lines on
+        color_box = np.zeros((y1-y0, x1-x0, 3), dtype=np.uint8)
+        for px, color in ((px_left, [255, 0, 0]), (px_right, [0, 0, 255])):
+            px = np.int32(np.rint(px[0])) - offset
+            inside = (px[:,0] >= 0) & (px[:,0] < x1-x0) & (px[:,1] >= 0) & (px[:,1] < y1-y0)
+            color_box[px[inside,1], px[inside,0]] = color
+        cv2.fillPoly(color_box, np.int_([pts - offset]), (0,255, 0))
+        cv2.polylines(color_box, np.int32([pts_left - offset]), isClosed=False, color=self.leftline.color, thickness=self.leftline.thickness)
+        cv2.polylines(color_box, np.int32([pts_right - offset]), isClosed=False, color=self.rightline.color, thickness=self.rightline.thickness)
+
+        # Combine the lane with the camera image inside the bounding box
+        result[y0:y1, x0:x1] = cv2.addWeighted(result[y0:y1, x0:x1], 1, color_box, 0.5, 0)
+        return result
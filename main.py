@@ -3,15 +3,23 @@ import cv2
 import argparse
 import config
 import os
+import sys
+import contextlib
+import csv
+import glob
+import json
+import time
 import numpy as np
+from multiprocessing import Pool
 from enum import Enum
-from moviepy.editor import VideoFileClip
 
 #project specific modules
-from thresholds import thresholdedImage
-from transforms import perspectiveTransform
+from thresholds import thresholdedImage, colorThresholds, threshold_strategies
+from transforms import perspectiveTransform, birdsEyeTransform
 from lanes import drivingLane
 from calibrations import cameraCalibration
+from profiling import stageProfiler
+from videos import threadedVideo, video_readers, video_writers, frame_range, split_frames, concatenate_videos
 
 pickle_file_path = 'camera_cal/camera_distortion_pickle.p'
 output_path = 'output_images/'
@@ -38,23 +46,99 @@ class pipeline:
         self.track = drivingLane()
         # pt encapsulates the transform matrices, warp and unwarp function
         self.pt = perspectiveTransform()
+        # bet combines the undistortion and the warp in a single remap
+        self.bet = birdsEyeTransform(self.cc, self.pt)
+        # ct holds the buffers for the color thresholds, reused for every frame
+        self.ct = colorThresholds()
         # copy the application mode
         self.mode = mode
+        # profiler measures the stages of every frame (see profiling.py)
+        self.profiler = stageProfiler(config.profile)
     #Pipeline for Lane processing
     def __call__(self, image):
+        with self.profiler.frame_stage():
+            return self.process(image)
+
+    #Runs the pipeline up to the detection of the lines, without rendering a
+    #result. Returns the lane (drivingLane) with the detected lines. Nothing
+    #is rendered from the frame, so it is not copied and the caller may reuse
+    #its buffer for the next frame.
+    def detect(self, image):
+        with self.profiler.frame_stage():
+            self.find_edges(image, copy=False)
+            with self.profiler.stage('detect_lines'):
+                self.track.detect_lines(self.edges , self.histogram_data, self.points, self.seed_fits)
+        return self.track
+
+    #Transforms and thresholds the image. Sets the binary image (edges), its
+    #histogram data and, if they are already extracted, the coordinates of the
+    #lane pixels (points). The incoming image is copied, unless 'copy' is False.
+    def find_edges(self, image, copy=True):
+        stage = self.profiler.stage
         #save a copy of the incoming image
-        self.original = np.copy(image)
-        #Undistort the given image
-        ret, undistorted = self.cc.undistort(self.original)
-        #apply perspective transform to the undistorted image
-        self.warped = self.pt.warp(undistorted)
+        self.original = np.copy(image) if copy else image
+        #fits of the coarse search, which seed the search of new lines
+        self.seed_fits = None
+        if config.transform_engine == 'sparse' and self.mode != OutputType.Warped:
+            #color threshold the frame before the transformation, only inside the
+            #region which is visible in the bird's eye view
+            height, width = self.original.shape[0], self.original.shape[1]
+            with stage('thresholds'):
+                self.binary = thresholdedImage(self.original, self.ct, config.threshold_strategy)
+                camera_binary = self.binary.applyThresholdsInRoi(self.bet.get_roi(width, height))
+            #undistort and transform only the binary image
+            with stage('warp'):
+                ret, warped_binary = self.bet.warp_binary(camera_binary)
+                self.edges , self.histogram_data = self.binary.setBinary(warped_binary)
+                self.points = None
+        else:
+            if config.transform_engine == 'dense':
+                #Undistort the given image
+                with stage('undistort'):
+                    ret, undistorted = self.cc.undistort(self.original)
+                #apply perspective transform to the undistorted image
+                with stage('warp'):
+                    self.warped = self.pt.warp(undistorted)
+            else:
+                #Undistort and apply perspective transform in a single pass
+                with stage('warp'):
+                    ret, self.warped = self.bet.warp(self.original)
+            #the mode Warped shows only the transformed image
+            if self.mode == OutputType.Warped:
+                return
+            self.binary = thresholdedImage(self.warped, self.ct, config.threshold_strategy)
+            height, width = self.warped.shape[0], self.warped.shape[1]
+            corridor = None
+            if config.debug_mode == False and self.mode in (OutputType.Final, OutputType.Lines):
+                if config.corridor_thresholds and self.track.is_tracking() and self.binary.isPerPixel():
+                    #while the lines are tracked, threshold only the corridor which
+                    #is searched around the previous fits
+                    corridor = self.track.search_corridor(height, width)
+                elif not self.track.is_tracking() and config.pyramid_scale > 1 and self.binary.isPerPixel():
+                    #search the lines in the reduced image and threshold only the
+                    #corridor around the coarse fits in full resolution
+                    with stage('coarse_search'):
+                        self.seed_fits = self.find_coarse_fits(config.pyramid_scale)
+                    if self.seed_fits[0] is not None and self.seed_fits[1] is not None:
+                        corridor = self.track.search_corridor(height, width, fits=self.seed_fits)
+                    else:
+                        self.seed_fits = None
+            with stage('thresholds'):
+                if corridor is not None:
+                    self.points = self.binary.applyThresholdsInCorridor(*corridor)
+                    self.edges , self.histogram_data = self.binary.rasterizePoints(self.points, self.warped.shape)
+                else:
+                    #color threshold the frames to filter the lane lines
+                    self.edges , self.histogram_data = self.binary.applyThresholds()
+                    self.points = None
+
+    def process(self, image):
+        stage = self.profiler.stage
+        self.find_edges(image)
         #special case. Return intermediate result. No further proecessing.
         #Use only for debugging purposes
         if self.mode == OutputType.Warped:
             return self.prepare_frames_side_by_side(self.original, self.warped)
-        #color threshold the frames to filter the lane lines
-        self.binary = thresholdedImage(self.warped)
-        self.edges , self.histogram_data = self.binary.applyThresholds()
         #special case. Return intermediate result. No further proecessing.
         #Use only for debugging purposes
         if self.mode == OutputType.Edges:
@@ -65,23 +149,43 @@ class pipeline:
             result = cv2.bitwise_or(result, self.binary.histogram)
             return self.prepare_frames_side_by_side(self.original, result)
         #find the lines based on the detected edges
-        self.track.detect_lines(self.edges , self.histogram_data)
-        #overlay the tracks on the distorted image
-        filled_track = self.track.overlay_lanes(self.original, self.edges)
-        if self.mode == OutputType.Lines:
-            return self.prepare_frames_side_by_side(self.original, filled_track)
-        #unwarp the combined image
-        unwarp = self.pt.unwarp(filled_track)
-        #Combine the result with the original image
-        self.result = cv2.addWeighted(self.original, 1, unwarp, 0.5, 0)
+        with stage('detect_lines'):
+            self.track.detect_lines(self.edges , self.histogram_data, self.points, self.seed_fits)
+        if config.overlay_mode == 'camera' and self.mode != OutputType.Lines:
+            #project the tracks to the camera image and draw them directly
+            with stage('overlay_lanes'):
+                self.result = self.track.overlay_lanes_on_camera(self.original, self.pt.Minv)
+        else:
+            #overlay the tracks on the distorted image
+            with stage('overlay_lanes'):
+                filled_track = self.track.overlay_lanes(self.original, self.edges)
+            if self.mode == OutputType.Lines:
+                return self.prepare_frames_side_by_side(self.original, filled_track)
+            #unwarp the combined image
+            with stage('unwarp'):
+                unwarp = self.pt.unwarp(filled_track)
+            #Combine the result with the original image
+            with stage('blend'):
+                self.result = cv2.addWeighted(self.original, 1, unwarp, 0.5, 0)
         #Calculate and display the curve radius and distance to the center of vehicle
-        self.result = self.appendHeader(self.result)
+        with stage('header'):
+            self.result = self.appendHeader(self.result)
         #Prepare the debug window
         if config.debug_mode == True:
-            self.result = self.prepare_debug_windows()
+            with stage('debug'):
+                self.result = self.prepare_debug_windows()
         #end of pipeline.
         return self.result
 
+    #Thresholds the warped image reduced by 'scale' and returns the fits of the
+    #sliding window search on it, scaled to the full resolution
+    def find_coarse_fits(self, scale):
+        height, width = self.warped.shape[0], self.warped.shape[1]
+        coarse = cv2.resize(self.warped, (width//scale, height//scale), interpolation=cv2.INTER_AREA)
+        coarse_binary = thresholdedImage(coarse, self.ct, config.threshold_strategy)
+        coarse_edges, coarse_histogram = coarse_binary.applyThresholds()
+        return self.track.find_coarse_fits(coarse_edges, coarse_histogram, scale)
+
     #Adds the calculated radius of curvature and vehicle position on the video frames
     def appendHeader(self, image):
         result = np.copy(image)
@@ -200,21 +304,23 @@ class pipeline:
         return diagnose
 
     def prepare_debug_windows(self, width=config.IMAGE_WIDTH, height=config.IMAGE_HEIGHT):
-        result = np.zeros((height, width, 3))
+        # uint8 like the saved result, cv2.putText accepts only 8 bit images
+        result = np.zeros((height, width, 3), dtype=np.uint8)
 
         #prepare the edges for displaying in debug window
         edges_bin = np.dstack((self.edges*255, self.edges*255, self.edges*255))
         #prepare the histogram for displaying in debug window
         hist_bin = self.binary.histogram
         #prepare the window rects
-        rect_bin = np.zeros_like (result)
+        rect_bin = np.zeros_like (edges_bin)
         for i, rect in enumerate(self.track.left_window_rects):
             cv2.rectangle(rect_bin, (rect[0], rect[1]),( rect[2], rect[3]), (255,255,0),2)
         for i, rect in enumerate(self.track.right_window_rects):
             cv2.rectangle(rect_bin, (rect[0], rect[1]),( rect[2], rect[3]), (255,255,0),2)
-        #print the init_weights
-        for i, weight in enumerate(self.binary.weights):
-            cv2.circle(rect_bin, (i,int(720-weight)), radius=2, color=(255,0,255), thickness=-1)
+        #print the histogram weights
+        weights = thresholdedImage.getHistogramWeights(self.edges.shape[1], self.edges.shape[0])
+        for i, weight in enumerate(weights):
+            cv2.circle(rect_bin, (i,int(self.edges.shape[0]-weight)), radius=2, color=(255,0,255), thickness=-1)
         #combine the edges, histogram and window rects in a single quadrant
         edges_bin = cv2.bitwise_or(edges_bin, hist_bin)
         edges_bin = cv2.bitwise_or(edges_bin, rect_bin)
@@ -245,25 +351,119 @@ class pipeline:
 
 # function which reads in a video and prepares the frames for the pipeline
 def processVideo(filename, start, end, mode=OutputType.Final):
-    clip = VideoFileClip(filename)
-    if start > 0 and end > 0:
-        print('processing input video from ' + str(start) + ' to ' + str(end) + ' seconds')
-        clip = clip.subclip(start,end)
-    snapshot = clip.fl_image(pipeline(mode) )
-
     if config.debug_mode == False:
         result_file_name = 'result_' + str(mode) + '_' + os.path.basename(filename)
     else:
         result_file_name = 'debug_result_' + os.path.basename(filename)
-    snapshot.write_videofile(output_path_video + result_file_name, audio=False)
+    if config.video_execution == 'chunks':
+        processVideoChunks(filename, start, end, mode, output_path_video + result_file_name)
+        return
+
+    if config.video_execution == 'serial' and config.video_backend == 'moviepy':
+        from moviepy.editor import VideoFileClip
+        clip = VideoFileClip(filename)
+        if start > 0 and end > 0:
+            print('processing input video from ' + str(start) + ' to ' + str(end) + ' seconds')
+            clip = clip.subclip(start,end)
+        pl = pipeline(mode)
+        snapshot = clip.fl_image(pl)
+        snapshot.write_videofile(output_path_video + result_file_name, audio=False)
+    else:
+        #the decoder of the threaded execution reads ahead up to the queue size
+        reader = video_readers[config.video_backend](filename, config.video_queue_size + 2)
+        first, last = frame_range(reader, start, end)
+        if start > 0 and end > 0:
+            print('processing input video from ' + str(start) + ' to ' + str(end) + ' seconds')
+        writer = video_writers[config.video_backend](output_path_video + result_file_name, reader.fps)
+        pl = pipeline(mode)
+        try:
+            if config.video_execution == 'threaded':
+                #decode, process and encode the frames in separate threads
+                video = threadedVideo(pl, config.video_queue_size)
+                video.run(reader.frames(first, last), writer.write)
+                video.report()
+            else:
+                for frame in reader.frames(first, last):
+                    writer.write(pl(frame))
+        finally:
+            writer.close()
+            reader.close()
+    save_profile(pl, filename)
+    print_counters(pl.track.tracker.counters)
     return
 
+def print_counters(counters):
+    print ('frames - rescans: ' + str(counters['rescans']) + ', tracking: ' + str(counters['tracking']) +
+           ', predicted: ' + str(counters['predicted']))
+
+# splits the frames of the video into config.jobs segments, which are
+# processed in parallel by processVideoChunk, and concatenates the results
+def processVideoChunks(filename, start, end, mode, result_file_name):
+    reader = video_readers[config.video_backend](filename)
+    fps = reader.fps
+    first, last = frame_range(reader, start, end)
+    reader.close()
+    if start > 0 and end > 0:
+        print('processing input video from ' + str(start) + ' to ' + str(end) + ' seconds')
+    # the settings are passed to the workers, which do not share the config module
+    settings = {name: value for name, value in vars(config).items()
+                if not name.startswith('_') and isinstance(value, (bool, int, float, str, tuple))}
+    warm_up = int(round(config.chunk_warm_up*fps))
+    tasks = []
+    for i, (segment_first, segment_last) in enumerate(split_frames(first, last, config.jobs)):
+        part_file_name = result_file_name + '.part' + str(i) + '.mp4'
+        tasks.append((filename, mode, settings, max(segment_first - warm_up, 0), segment_first, segment_last, part_file_name))
+    print ('processing ' + str(last - first) + ' frames in ' + str(len(tasks)) + ' segments')
+    with Pool(len(tasks)) as pool:
+        results = pool.map(processVideoChunk, tasks)
+    part_file_names = [task[-1] for task in tasks]
+    try:
+        concatenate_videos(part_file_names, result_file_name)
+    finally:
+        for part_file_name in part_file_names:
+            if os.path.exists(part_file_name):
+                os.remove(part_file_name)
+    print_counters({name: sum(counters[name] for counters in results) for name in results[0]})
+
+# Processes the frames first ... last-1 of the video into a separate file. The
+# frames from 'warm_up_first' on are processed before, without output.
+# Returns the counters of the tracker for the written frames only.
+def processVideoChunk(task):
+    filename, mode, settings, warm_up_first, first, last, part_file_name = task
+    for name, value in settings.items():
+        setattr(config, name, value)
+    reader = video_readers[config.video_backend](filename)
+    writer = video_writers[config.video_backend](part_file_name, reader.fps)
+    pl = pipeline(mode)
+    counters = pl.track.tracker.counters
+    warm_up_counters = None
+    try:
+        for i, frame in enumerate(reader.frames(warm_up_first, last), warm_up_first):
+            if i == first:
+                warm_up_counters = dict(counters)
+            result = pl(frame)
+            if i >= first:
+                writer.write(result)
+    finally:
+        writer.close()
+        reader.close()
+    if warm_up_counters is None:
+        # no frame of the segment was read
+        return dict.fromkeys(counters, 0)
+    return {name: counters[name] - warm_up_counters[name] for name in counters}
+
 # function which reads in a image file and prepares the frames for the pipeline
 def processImage(filename, mode=OutputType.Final):
     image = mpimg.imread(filename)
 
     pl = pipeline(mode)
     result = pl(image)
+    result_file_name = saveImageResult(result, filename)
+    print ('Results saved at ' + result_file_name )
+    save_profile(pl, filename)
+
+# saves the result of an image in the output folder and returns its file name
+def saveImageResult(result, filename):
     if config.debug_mode == False:
         result_file_name = 'result_' + os.path.basename(filename)
     else:
@@ -271,7 +471,123 @@ def processImage(filename, mode=OutputType.Final):
     #imsave expects pixel values as uint8
     result = np.array(result, dtype=np.uint8).reshape(result.shape)
     mpimg.imsave(output_path + result_file_name, result)
-    print ('Results saved at ' + output_path + result_file_name )
+    return output_path + result_file_name
+
+# pipeline of a worker of the batch mode, created once per process
+batch_pipeline = None
+
+def initBatchWorker(mode, settings):
+    global batch_pipeline
+    for name, value in settings.items():
+        setattr(config, name, value)
+    batch_pipeline = pipeline(mode)
+
+# Processes one image of the batch mode in a worker. The calibration and the
+# transforms of the worker's pipeline are reused, the lane is detected from
+# scratch. Returns the row of the summary.
+def processBatchImage(filename):
+    start = time.perf_counter()
+    row = {'file': filename, 'detected': False, 'radius': '', 'offset': '', 'status': 'ok'}
+    try:
+        image = mpimg.imread(filename)
+        batch_pipeline.track = drivingLane()
+        saveImageResult(batch_pipeline(image), filename)
+        track = batch_pipeline.track
+        row['detected'] = track.is_detected()
+        if track.leftline.best_fit is not None and track.rightline.best_fit is not None:
+            row['radius'] = '{:0.2f}'.format(track.get_curve_radius())
+            row['offset'] = '{:0.3f}'.format(track.get_vehicle_pos(image.shape))
+    except Exception as error:
+        row['status'] = 'error: ' + ' '.join(str(error).split())
+    row['ms'] = '{:0.1f}'.format((time.perf_counter() - start)*1000)
+    return row
+
+# Processes the images of a directory or glob pattern on config.jobs processes.
+# The workers save the results and return only the rows of the summary, which
+# are written to output_images/batch_summary.csv as they arrive.
+def processImages(pattern, mode=OutputType.Final):
+    if os.path.isdir(pattern):
+        filenames = sorted(name for name in glob.glob(os.path.join(pattern, '*'))
+                           if os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg', '.png'))
+    else:
+        filenames = sorted(glob.glob(pattern))
+    settings = {name: value for name, value in vars(config).items()
+                if not name.startswith('_') and isinstance(value, (bool, int, float, str, tuple))}
+    summary_file_name = output_path + 'batch_summary.csv'
+    print ('processing ' + str(len(filenames)) + ' images on ' + str(config.jobs) + ' processes')
+    start = time.perf_counter()
+    counts = {'detected': 0, 'failed': 0}
+    with open(summary_file_name, 'w', newline='') as f, \
+         Pool(config.jobs, initializer=initBatchWorker, initargs=(mode, settings)) as pool:
+        writer = csv.DictWriter(f, fieldnames=['file', 'detected', 'radius', 'offset', 'status', 'ms'])
+        writer.writeheader()
+        for row in pool.imap(processBatchImage, filenames, chunksize=4):
+            writer.writerow(row)
+            counts['detected'] += row['detected']
+            counts['failed'] += row['status'] != 'ok'
+    elapsed = time.perf_counter() - start
+    print ('{} images in {:0.1f} s ({:0.1f} images/s), lanes detected: {}, failed: {}'.format(
+        len(filenames), elapsed, len(filenames)/elapsed if elapsed > 0 else 0., counts['detected'], counts['failed']))
+    print ('Summary saved at ' + summary_file_name)
+
+# Reads raw RGB frames (height x width x 3 bytes each) from stdin ('-') or a
+# file / named pipe and writes one JSON line per frame to stdout with the best
+# fits of the lines, the radius of curvature (m), the position of the vehicle
+# (m) and the detection state. Radius and position are null, if a line has no
+# fit. Only the detection of the pipeline runs, no result is rendered or
+# saved. The frames are read into one reused buffer.
+def processStream(source, width, height):
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame_bytes = memoryview(frame).cast('B')
+    stream = sys.stdin.buffer if source == '-' else open(source, 'rb', buffering=0)
+    pl = pipeline(OutputType.Final)
+    index = 0
+    try:
+        while readFrame(stream, frame_bytes):
+            start = time.perf_counter()
+            track = pl.detect(frame)
+            left_fit, right_fit = track.leftline.best_fit, track.rightline.best_fit
+            #radius and offset are measured only with the fits of both lines
+            lane_found = left_fit is not None and right_fit is not None
+            record = {'frame': index,
+                      'detected': bool(track.is_detected()),
+                      'left_fit': None if left_fit is None else [float(c) for c in left_fit],
+                      'right_fit': None if right_fit is None else [float(c) for c in right_fit],
+                      'radius': float(track.get_curve_radius()) if lane_found else None,
+                      'offset': float(track.get_vehicle_pos(frame.shape)) if lane_found else None,
+                      'ms': round((time.perf_counter() - start)*1000, 3)}
+            sys.stdout.write(json.dumps(record) + '\n')
+            sys.stdout.flush()
+            index += 1
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+    #stdout carries only the JSON lines
+    with contextlib.redirect_stdout(sys.stderr):
+        save_profile(pl, 'stream')
+
+# Fills the buffer with the next frame. Returns False at the end of the stream.
+def readFrame(stream, buffer):
+    filled = 0
+    while filled < len(buffer):
+        count = stream.readinto(buffer[filled:])
+        if not count:
+            if filled > 0:
+                sys.stderr.write('incomplete frame of ' + str(filled) + ' bytes at the end of the stream\n')
+            return False
+        filled += count
+    return True
+
+# writes the stage times of the pipeline as CSV summary and Chrome trace, if
+# the profiler is enabled
+def save_profile(pl, filename):
+    if not pl.profiler.enabled:
+        return
+    profile_file_name = output_path + 'profile_' + os.path.splitext(os.path.basename(filename))[0]
+    pl.profiler.print_summary()
+    pl.profiler.write_summary(profile_file_name + '.csv')
+    pl.profiler.write_trace(profile_file_name + '.json')
+    print ('Profile saved at ' + profile_file_name + '.csv and ' + profile_file_name + '.json')
 
 #start-up function - Reads in the program arguments and prepares the respective pipelines
 def main():
@@ -281,9 +597,34 @@ def main():
     parser.add_argument('--debug', dest='debug_mode', action='store_true')
     parser.add_argument('--timeslot', dest='timeslot')
     parser.add_argument('--mode', dest='mode', type=OutputType, choices=list(OutputType))
+    parser.add_argument('--engine', dest='engine', choices=['dense', 'remap', 'sparse'], default=config.transform_engine)
+    parser.add_argument('--threshold', dest='threshold', choices=list(threshold_strategies), default=config.threshold_strategy)
+    parser.add_argument('--full-frame', dest='corridor', action='store_false', help='threshold the full frame also while tracking')
+    parser.add_argument('--pyramid', dest='pyramid', type=int, choices=[1, 2, 4], default=config.pyramid_scale)
+    parser.add_argument('--max-missed', dest='max_missed', type=int, default=config.max_missed_frames)
+    parser.add_argument('--no-jit', dest='jit', action='store_false', help='use the NumPy lane search instead of the numba kernels')
+    parser.add_argument('--execution', dest='execution', choices=['serial', 'threaded', 'chunks'], default=config.video_execution)
+    parser.add_argument('--backend', dest='backend', choices=['moviepy', 'opencv'], default=config.video_backend)
+    parser.add_argument('--jobs', dest='jobs', type=int, default=config.jobs, help='processes of the chunks execution and the batch mode')
+    parser.add_argument('--warm-up', dest='warm_up', type=float, default=config.chunk_warm_up, help='seconds processed before each segment')
+    parser.add_argument('--stream', dest='stream', action='store_true', help='raw RGB frames from the file (- for stdin), JSON lines to stdout')
+    parser.add_argument('--width', dest='width', type=int, default=config.IMAGE_WIDTH, help='frame width of the stream')
+    parser.add_argument('--height', dest='height', type=int, default=config.IMAGE_HEIGHT, help='frame height of the stream')
+    parser.add_argument('--profile', dest='profile', action='store_true', help='measure the stages of the pipeline')
     #read command line agruments
     args = parser.parse_args()
     config.debug_mode = args.debug_mode
+    config.transform_engine = args.engine
+    config.threshold_strategy = args.threshold
+    config.corridor_thresholds = args.corridor and config.corridor_thresholds
+    config.pyramid_scale = args.pyramid
+    config.max_missed_frames = args.max_missed
+    config.compiled_kernels = args.jit and config.compiled_kernels
+    config.profile = args.profile or config.profile
+    config.video_execution = args.execution
+    config.video_backend = args.backend
+    config.jobs = args.jobs
+    config.chunk_warm_up = args.warm_up
 
     time_count = args.timeslot
     start = 0
@@ -303,8 +644,12 @@ def main():
     if args.mode:
         mode = args.mode
 
-    if args.filename[-4:] == '.mp4':
+    if args.stream:
+        processStream(args.filename, args.width, args.height)
+    elif args.filename[-4:] == '.mp4':
         processVideo(args.filename, start, end, mode)
+    elif os.path.isdir(args.filename) or any(c in args.filename for c in '*?['):
+        processImages(args.filename, mode)
     else: ##assuming image
         processImage (args.filename, mode)
 
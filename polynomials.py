@@ -0,0 +1,119 @@
+# This module fits the second order polynomials x = f(y) of the lane lines.
+# Instead of running np.polyfit over every pixel, the pixels are aggregated
+# per image row (pixel count and sum of x). The least squares fit of the
+# pixels is the weighted fit of the mean x per row, so it is solved on the
+# occupied rows only. A fit therefore costs O(rows) once the aggregates are
+# available.
+import numpy as np
+import config
+
+class rowMoments:
+    def __init__(self, height=config.IMAGE_HEIGHT):
+        self.height = height
+        # number of pixels per row
+        self.counts = np.zeros(self.height)
+        # sum of the x coordinates per row
+        self.xsums = np.zeros(self.height)
+
+    # adds the pixels with the coordinates x and y (rows) to the aggregates
+    def add(self, x, y, weight=1.):
+        if len(y) > 0:
+            self.counts += weight*np.bincount(y, minlength=self.height)[:self.height]
+            self.xsums += weight*np.bincount(y, weights=x, minlength=self.height)[:self.height]
+        return self
+
+    # number of aggregated pixels
+    def count(self):
+        return self.counts.sum()
+
+    # returns the coefficients of the second order polynomial (highest power
+    # first, like np.polyfit) or None, if there are no pixels.
+    def fit(self):
+        rows = self.counts.nonzero()[0]
+        if len(rows) == 0:
+            return None
+        counts = self.counts[rows]
+        # The rows are centred on the mean row of the pixels and scaled to
+        # [-1, 1]. The pixels of a window or a band often cover only a short
+        # range of rows, where the powers of the plain row numbers are almost
+        # collinear. The system is solved with lstsq instead of the normal
+        # equations, which would square its condition number. lstsq also
+        # returns the minimum norm solution if the pixels are in less than
+        # three rows.
+        mean = np.dot(counts, rows)/counts.sum()
+        scale = max(np.abs(rows - mean).max(), 1.)
+        t = (rows - mean)/scale
+        w = np.sqrt(counts)
+        # weighted rows: sqrt(count) * (mean x of the row - f(t)) for every row
+        a = np.vander(t, 3)*w[:, None]
+        p2, p1, p0 = np.linalg.lstsq(a, self.xsums[rows]/w, rcond=None)[0]
+        # undo the centring and the scaling of the rows
+        return np.array([p2/scale**2,
+                         p1/scale - 2*p2*mean/scale**2,
+                         p2*mean**2/scale**2 - p1*mean/scale + p0])
+
+# fits a second order polynomial x = f(y) to pixels with integer rows y
+def polyfit_rows(y, x, height=config.IMAGE_HEIGHT):
+    return rowMoments(height).add(x, y).fit()
+
+# converts the coefficients of x = f(y) to the coefficients of the same curve
+# with x scaled by x_scale and y scaled by y_scale, e.g. from pixels to meters.
+# A least squares fit of the scaled pixels gives exactly the same coefficients.
+def scale_fit(fit, x_scale, y_scale):
+    return np.array([fit[0]*x_scale/y_scale**2, fit[1]*x_scale/y_scale, fit[2]*x_scale])
+
+# converts the fit of an image reduced by the integer 'scale' (e.g. by
+# cv2.resize with INTER_AREA) to the fit of the full resolution image. The
+# center of the reduced pixel i is at scale*i + (scale-1)/2 in full resolution.
+def rescale_fit(fit, scale):
+    a, b, c = fit
+    o = (scale - 1)/2
+    return np.array([a/scale, b - 2*a*o/scale, a*o**2/scale - b*o + scale*c + o])
+
+# Value object of a fitted polynomial x = f(y) of a lane line. The quantities
+# derived from the fit (x values, intercepts, fit in meters, radius of
+# curvature) are calculated on first use and cached. Every new fit gets a new
+# object, so the cached values never need to be invalidated.
+class lanePolynomial:
+    __slots__ = ('fit', 'cache')
+
+    def __init__(self, fit):
+        # copy the coefficients, the cached values must not change with them
+        self.fit = np.array(fit, dtype=np.float64)
+        self.cache = {}
+
+    # x value of the polynomial at the row y
+    def x_at(self, y):
+        key = ('x', y)
+        if key not in self.cache:
+            self.cache[key] = self.fit[0]*y**2 + self.fit[1]*y + self.fit[2]
+        return self.cache[key]
+
+    # x value at the bottom of the image, where the line meets the vehicle
+    def intercept(self, height=config.IMAGE_HEIGHT):
+        return self.x_at(height)
+
+    # x values of all rows of the image. The returned array is shared and
+    # must not be modified.
+    def x_values(self, height=config.IMAGE_HEIGHT):
+        key = ('x_values', height)
+        if key not in self.cache:
+            ploty = np.linspace(0, height-1, num=height)
+            self.cache[key] = self.fit[0]*ploty**2 + self.fit[1]*ploty + self.fit[2]
+        return self.cache[key]
+
+    # coefficients of the polynomial in meters
+    def metric_fit(self, xm_per_pix, ym_per_pix):
+        key = ('metric_fit', xm_per_pix, ym_per_pix)
+        if key not in self.cache:
+            self.cache[key] = scale_fit(self.fit, xm_per_pix, ym_per_pix)
+        return self.cache[key]
+
+    # radius of curvature in meters at the bottom row of the image
+    def radius(self, ym_per_pix, xm_per_pix, height=config.IMAGE_HEIGHT):
+        key = ('radius', ym_per_pix, xm_per_pix, height)
+        if key not in self.cache:
+            fit_cr = self.metric_fit(xm_per_pix, ym_per_pix)
+            y_eval = (height-1)*ym_per_pix
+            self.cache[key] = ((1 + (2*fit_cr[0]*y_eval + fit_cr[1])**2)**1.5)/abs(2*fit_cr[0])
+        return self.cache[key]
@@ -0,0 +1,106 @@
+# This module measures the wall time of the stages of the pipeline per frame.
+# The stages are enclosed in 'with profiler.stage(name):'. A disabled profiler
+# returns the same empty context for every stage, so the instrumentation costs
+# only a method call per stage.
+# The recorded times are written as
+#  - CSV summary: count, mean, p50, p95 and p99 in ms per stage
+#  - Chrome trace (JSON): one event per stage and frame, which can be opened
+#    in chrome://tracing or https://ui.perfetto.dev
+# Hooks receive every measured stage as it ends, e.g. to forward the times to
+# other metrics:
+#   profiler.add_hook(lambda name, frame, start, duration: print(name, duration))
+# with 'start' in seconds since the profiler was created and 'duration' in ms.
+import csv
+import json
+import time
+import numpy as np
+
+# name of the stage which encloses all stages of a frame
+FRAME_STAGE = 'frame'
+
+class nullStage:
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+null_stage = nullStage()
+
+# context of one measured stage
+class stageTimer:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+class stageProfiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.hooks = []
+        self.origin = time.perf_counter()
+        self.frame = -1
+        # durations in ms per stage, in the order the stages appear
+        self.times = {}
+        # (name, frame, start, duration) in ms since origin
+        self.events = []
+
+    # callback(name, frame, start, duration), see above. Enables the profiler.
+    def add_hook(self, callback):
+        self.hooks.append(callback)
+        self.enabled = True
+
+    def stage(self, name):
+        if not self.enabled:
+            return null_stage
+        return stageTimer(self, name)
+
+    # encloses all stages of the next frame
+    def frame_stage(self):
+        if not self.enabled:
+            return null_stage
+        self.frame += 1
+        return stageTimer(self, FRAME_STAGE)
+
+    def record(self, name, start, end):
+        start = (start - self.origin)*1000
+        duration = (end - self.origin)*1000 - start
+        self.times.setdefault(name, []).append(duration)
+        self.events.append((name, self.frame, start, duration))
+        for callback in self.hooks:
+            callback(name, self.frame, start/1000, duration)
+
+    # rows of the summary: stage, count, mean, p50, p95, p99 (ms)
+    def summary(self):
+        rows = []
+        for name, times in self.times.items():
+            p50, p95, p99 = np.percentile(times, [50, 95, 99])
+            rows.append({'stage': name, 'count': len(times), 'mean': np.mean(times), 'p50': p50, 'p95': p95, 'p99': p99})
+        return rows
+
+    def write_summary(self, file_name):
+        with open(file_name, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['stage', 'count', 'mean', 'p50', 'p95', 'p99'])
+            writer.writeheader()
+            for row in self.summary():
+                writer.writerow({key: '{:0.3f}'.format(value) if isinstance(value, float) else value
+                                 for key, value in row.items()})
+
+    # Chrome trace event format, complete events ('X') with times in us
+    def write_trace(self, file_name):
+        events = [{'name': name, 'cat': 'pipeline', 'ph': 'X', 'pid': 1, 'tid': 1,
+                   'ts': round(start*1000, 3), 'dur': round(duration*1000, 3), 'args': {'frame': frame}}
+                  for name, frame, start, duration in self.events]
+        with open(file_name, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def print_summary(self):
+        for row in self.summary():
+            print ('{:<16s} n {:5d}  p50 {:8.3f} ms  p95 {:8.3f} ms  p99 {:8.3f} ms'.format(
+                row['stage'], row['count'], row['p50'], row['p95'], row['p99']))
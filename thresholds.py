@@ -9,9 +9,106 @@ from calibrations import cameraCalibration
 
 pickle_file_path = 'camera_cal/camera_distortion_pickle.p'
 
+# Computes the same binary image as thresholdedImage.luv_l_thresh OR
+# thresholdedImage.lab_b_thresh for uint8 images, without any float images.
+# The scaling of a channel with its maximum and the thresholds are combined in
+# a lookup table of 256 entries, which is applied with cv2.LUT. All images are
+# written into buffers, which are reused for every frame of the same size.
+# The returned binary image is one of these buffers. It is only valid until
+# the next call.
+class colorThresholds:
+    def __init__(self, l_thresh=(220, 255), b_thresh=(190, 255)):
+        self.l_thresh = l_thresh
+        self.b_thresh = b_thresh
+        self.levels = np.arange(256, dtype=np.float64)
+        # buffers per image size (height, width)
+        self.buffers = {}
+
+    # Lookup table of the binary output for all 256 levels of a channel, which
+    # is scaled with 'scale' and thresholded with (thresh[0], thresh[1]]
+    def lookup_table(self, scale, thresh):
+        if not np.isfinite(scale):
+            return np.zeros(256, dtype=np.uint8)
+        scaled = self.levels*scale
+        return ((scaled > thresh[0]) & (scaled <= thresh[1])).astype(np.uint8)
+
+    def get_buffers(self, height, width):
+        if (height, width) not in self.buffers:
+            self.buffers[(height, width)] = (np.empty((height, width, 3), dtype=np.uint8),   # color space
+                                             np.empty((height, width), dtype=np.uint8),      # channel
+                                             np.empty((height, width), dtype=np.uint8),      # l binary
+                                             np.empty((height, width), dtype=np.uint8))      # result
+        return self.buffers[(height, width)]
+
+    def apply(self, image):
+        converted, channel, l_binary, result = self.get_buffers(image.shape[0], image.shape[1])
+        # l channel of the Luv color space, scaled with its maximum
+        cv2.cvtColor(image, cv2.COLOR_RGB2Luv, dst=converted)
+        cv2.extractChannel(converted, 0, dst=channel)
+        l_max = cv2.minMaxLoc(channel)[1]
+        scale = 255/l_max if l_max > 0 else np.inf
+        cv2.LUT(channel, self.lookup_table(scale, self.l_thresh), dst=l_binary)
+        # b channel of the Lab color space. No scaling if there are no yellows in the image
+        cv2.cvtColor(image, cv2.COLOR_RGB2Lab, dst=converted)
+        cv2.extractChannel(converted, 2, dst=channel)
+        b_max = cv2.minMaxLoc(channel)[1]
+        scale = 255/b_max if b_max > 175 else 1.
+        cv2.LUT(channel, self.lookup_table(scale, self.b_thresh), dst=result)
+        # Combine Luv and Lab B color space channel thresholds
+        cv2.bitwise_or(l_binary, result, dst=result)
+        return result
+
+# Gradients of a grayscale image. The sobel derivatives in x and y are
+# calculated once (float32) and shared by all gradient thresholds. The scaled
+# absolute values, the magnitude and the direction are derived on first use.
+class gradientField:
+    def __init__(self, gray, sobel_kernel=3):
+        self.sobelx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=sobel_kernel)
+        self.sobely = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=sobel_kernel)
+        self.cache = {}
+
+    # absolute value of the gradient in 'x' or 'y' direction, rescaled to 8 bit
+    def scaled_abs(self, orient='x'):
+        key = ('abs', orient)
+        if key not in self.cache:
+            abs_sobel = np.absolute(self.sobelx if orient == 'x' else self.sobely)
+            self.cache[key] = np.uint8(abs_sobel*(255/np.max(abs_sobel)))
+        return self.cache[key]
+
+    # magnitude of the gradient, rescaled to 8 bit
+    def scaled_magnitude(self):
+        if 'magnitude' not in self.cache:
+            gradmag = cv2.magnitude(self.sobelx, self.sobely)
+            self.cache['magnitude'] = (gradmag*(255/np.max(gradmag))).astype(np.uint8)
+        return self.cache['magnitude']
+
+    # absolute direction of the gradient in radians (0 .. pi/2)
+    def direction(self):
+        if 'direction' not in self.cache:
+            self.cache['direction'] = np.arctan2(np.absolute(self.sobely), np.absolute(self.sobelx))
+        return self.cache['direction']
+
+    # binary images (uint8) of the thresholds, limits are inclusive
+    def abs_sobel_thresh(self, orient='x', thresh=(0,255)):
+        return self.thresh(self.scaled_abs(orient), thresh)
+
+    def mag_thresh(self, thresh=(0, 255)):
+        return self.thresh(self.scaled_magnitude(), thresh)
+
+    def dir_threshold(self, thresh=(0, np.pi/2)):
+        return self.thresh(self.direction(), thresh)
+
+    def thresh(self, values, thresh):
+        return ((values >= thresh[0]) & (values <= thresh[1])).astype(np.uint8)
+
 class thresholdedImage:
-    def __init__(self, image):
+    # 'engine' is an optional colorThresholds object, which is used for uint8 images
+    # 'strategy' is the name of the thresholds in threshold_strategies
+    def __init__(self, image, engine=None, strategy='luv_lab'):
         self.image = image
+        self.engine = engine
+        self.strategy = strategy
+        self.histogram_image = None
 
     # Thresholds derived from the knowledge article
     # https://knowledge.udacity.com/questions/32588
@@ -44,53 +141,148 @@ class thresholdedImage:
     # l channel from the Luv color space and b channel from Lab color
     # space
     def applyThresholds(self):
+        self.result = self.combinedThresholds(self.image)
 
-        l_binary_output = self.luv_l_thresh(self.image)
-        b_binary_output = self.lab_b_thresh(self.image)
-
-        # Combine Luv and Lab B color space channel thresholds
-        self.result = np.zeros_like(l_binary_output)
-        self.result[(l_binary_output == 1) | (b_binary_output == 1)] = 1
-
-        # create the histogram for debug purposes
-        self.histogram = self.getHistogram()
+        # histogram data for the search of the lane lines
+        self.getHistogramData()
         return self.result , self.histogram_data
 
-    #return the histogram of the thresholded image
-    def getHistogram(self):
+    # Applies the same thresholds as applyThresholds, but only inside the
+    # given polygon of the (not transformed) camera image. Returns the binary
+    # image of the whole camera image, which is 0 outside of the polygon.
+    def applyThresholdsInRoi(self, vertices):
+        height, width = self.image.shape[0], self.image.shape[1]
+        # threshold only the bounding box of the polygon
+        x, y, w, h = cv2.boundingRect(vertices)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x+w, width), min(y+h, height)
+        binary_output = np.zeros((height, width), dtype=np.uint8)
+        binary_output[y0:y1, x0:x1] = self.combinedThresholds(self.image[y0:y1, x0:x1])
+
+        # mask out the pixels of the bounding box outside of the polygon
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(mask, [vertices], 1)
+        return cv2.bitwise_and(binary_output, mask, dst=binary_output)
+
+    # Applies the thresholds only to the pixels of a search corridor, given by
+    # the columns 'cols' (height x n) of every row and the mask 'valid' of the
+    # columns inside the image (see drivingLane.search_corridor). The pixels of
+    # the corridor are gathered into an image of n columns, so the channels
+    # are scaled with their maximum within the corridor instead of the whole
+    # image. Returns the x and y coordinates of the detected pixels, sorted by
+    # row like nonzero(). Valid only for per pixel strategies (see isPerPixel).
+    def applyThresholdsInCorridor(self, cols, valid):
+        height, width = self.image.shape[0], self.image.shape[1]
+        # gather the corridor with a nearest neighbour remap, which is much
+        # faster than fancy indexing of the color image
+        rows = np.broadcast_to(np.arange(height)[:, None], cols.shape)
+        corridor_map = np.dstack((np.clip(cols, 0, width-1), rows)).astype(np.int16)
+        corridor = cv2.remap(self.image, corridor_map, None, cv2.INTER_NEAREST)
+        binary_output = self.combinedThresholds(corridor)
+        rows, offsets = ((binary_output == 1) & valid).nonzero()
+        return cols[rows, offsets], rows
+
+    # Returns the binary image of the selected threshold strategy
+    def combinedThresholds(self, img):
+        return threshold_strategies[self.strategy](self, img)
+
+    # True if the selected strategy thresholds every pixel on its own, so it
+    # can be applied to the gathered corridor of applyThresholdsInCorridor
+    def isPerPixel(self):
+        return self.strategy in per_pixel_strategies
+
+    # Returns the binary image combining (OR) the thresholded l channel of the
+    # Luv color space and the b channel of the Lab color space.
+    def luvLabThresholds(self, img):
+        if self.engine is not None and img.dtype == np.uint8:
+            return self.engine.apply(img)
+
+        l_binary_output = self.luv_l_thresh(img)
+        b_binary_output = self.lab_b_thresh(img)
+
+        # Combine Luv and Lab B color space channel thresholds
+        result = np.zeros_like(l_binary_output)
+        result[(l_binary_output == 1) | (b_binary_output == 1)] = 1
+        return result
+
+    # Sets the binary image, e.g. transformed from the camera image, and
+    # calculates its histogram data
+    def setBinary(self, binary):
+        self.result = binary
+        self.getHistogramData()
+        return self.result, self.histogram_data
+
+    # Builds the binary image (and the histogram) from the x and y
+    # coordinates of the detected pixels
+    def rasterizePoints(self, points, shape):
+        self.result = np.zeros(shape[:2], dtype=np.uint8)
+        self.result[points[1], points[0]] = 1
+        self.getHistogramData()
+        return self.result, self.histogram_data
+
+    # Weights of the histogram data per column, cached per image size
+    #divide the image in 4 equalcolumns
+    #the first and fourth colum would be 0. No lanes points are expected there
+    #the second column would progressively increase from 0 to 720 within the quadrant
+    #the third column would progressively decrease from 720 to 0 within the quadrant
+    histogram_weights = {}
+
+    @staticmethod
+    def getHistogramWeights(xsize, ysize):
+        if (xsize, ysize) not in thresholdedImage.histogram_weights:
+            x = np.arange(xsize, dtype=np.int64)
+            weights = np.trunc(4*x*ysize/xsize - ysize).astype(np.int64)
+            weights[(x <= xsize*0.25) | (x >= xsize*0.75)] = 0
+            weights = np.where(weights > ysize, 2*ysize - weights, weights)
+            thresholdedImage.histogram_weights[(xsize, ysize)] = weights
+        return thresholdedImage.histogram_weights[(xsize, ysize)]
+
+    #calculate the weighted histogram data of the thresholded image
+    def getHistogramData(self):
         binary = self.result
-        self.histogram = np.zeros_like((self.result))
-        self.histogram = np.dstack((self.histogram*255,self.histogram*255,self.histogram*255))
+        ysize = binary.shape[0]
+        xsize = binary.shape[1]
         # Grab only the bottom half of the image
         # Lane lines are likely to be mostly vertical nearest to the car
-        bottom_half = binary[binary.shape[0]//2:,:]
+        bottom_half = binary[ysize//2:,:]
         # Sum across image pixels vertically
-        self.histogram_data = np.sum(bottom_half, axis=0)
-        # Scale it for image size
-        ysize = binary.shape[0]
-        xsize = binary.shape[1]
-        #preparing weights for histoggram data to eliminate false detection of lanes
-        x = np.arange(start=0, stop=xsize, step=1, dtype=np.uint32)
-        #divide the image in 4 equalcolumns
-        #the first and fourth colum would be 0. No lanes points are expected there
-        #the second column would progressively increase from 0 to 720 within the quadrant
-        #the third column would progressively decrease from 720 to 0 within the quadrant
-        self.weights = [ int(4*i*ysize/xsize - ysize) if i > (xsize*0.25) and i < (xsize*0.75) else 0  for i in x]
-        self.weights = [ 2*ysize - (i)  if i > ysize else i  for i in self.weights]
-        self.histogram_data = self.histogram_data * self.weights
+        ddepth = cv2.CV_32S if binary.dtype == np.uint8 else cv2.CV_64F
+        self.histogram_data = cv2.reduce(bottom_half, 0, cv2.REDUCE_SUM, dtype=ddepth).ravel()
+        #weights for histoggram data to eliminate false detection of lanes
+        self.histogram_data = self.histogram_data * self.getHistogramWeights(xsize, ysize)
+        # the visual histogram is rendered on first use
+        self.histogram_image = None
+        return self.histogram_data
+
+    # Visual histogram for the debug windows. Rendered only if it is used.
+    @property
+    def histogram(self):
+        if self.histogram_image is None:
+            self.histogram_image = self.getHistogram()
+        return self.histogram_image
 
+    #return the histogram of the thresholded image
+    def getHistogram(self):
+        histogram = np.zeros_like((self.result))
+        histogram = np.dstack((histogram*255,histogram*255,histogram*255))
+        # Scale it for image size
+        ysize = self.result.shape[0]
+        xsize = self.result.shape[1]
         histogram_y = ysize - (np.interp(self.histogram_data, (self.histogram_data.min(),
                 self.histogram_data.max()), (0, ysize)).astype(int))
         histogram_x = np.arange(xsize).astype(int)
         #prepare the point for polylines
         points = np.vstack((histogram_x, histogram_y)).T
-        cv2.polylines(self.histogram, np.int32([points]), 0, (0,255,0), 5)
-        return self.histogram
+        cv2.polylines(histogram, np.int32([points]), 0, (0,255,0), 5)
+        return histogram
 
     #Alternate approach  suggested by reviewer
     #The performance of CLAHE+HSV is less than the current
     #approach in the project.
-    def prepareThreshold_2():
+    def prepareThreshold_2(self, image):
+        #CLAHE works on 8 bit images only
+        if image.dtype != np.uint8:
+            image = np.uint8(image*255)
         #preprocessing the images through a brightness adjustment filter
         #using a Contrast Limited Adaptive Histogram Equalization (CLAHE)
         #algorithm. This will help to better detect the yellow lane line road
@@ -98,13 +290,13 @@ class thresholdedImage:
         #subsequent steps (e.g. getting a binary threshold color mask for
         #yellow and white lane lines).
         lab = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
-        lab_planes = cv2.split(lab)
+        lab_planes = list(cv2.split(lab))
         _clahe = cv2.createCLAHE(clipLimit=2.0,tileGridSize=(8,8))
         lab_planes[0] = _clahe.apply(lab_planes[0])
         lab = cv2.merge(lab_planes)
         self.image_clahe = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
 
-        self.result = np.zeros((self.image_clahe.shape[0],self.image_clahe.shape[1]))
+        result = np.zeros((self.image_clahe.shape[0],self.image_clahe.shape[1]), dtype=np.uint8)
 
         hsv = cv2.cvtColor(self.image_clahe, cv2.COLOR_RGB2HSV)
         H = hsv[:,:,0]
@@ -122,13 +314,45 @@ class thresholdedImage:
         t_white_R = self.thresh(R,225,255)
         t_white_V = self.thresh(V,230,255)
 
-        self.result[(t_yellow_H==1) & (t_yellow_S==1) & (t_yellow_V==1)] = 1
-        self.result[(t_white_R==1)|(t_white_V==1)] = 1
+        result[(t_yellow_H==1) & (t_yellow_S==1) & (t_yellow_V==1)] = 1
+        result[(t_white_R==1)|(t_white_V==1)] = 1
+        return result
+
+    # Gradient thresholds from the exploration (see print_gradient_thresholds):
+    # sobel x AND sobel y, OR magnitude, OR the s channel of HLS
+    def gradientThresholds(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        gradients = gradientField(gray, sobel_kernel = config.kernel_size)
+        gradx = gradients.abs_sobel_thresh(orient='x', thresh = config.sobel_x_thresholds)
+        grady = gradients.abs_sobel_thresh(orient='y', thresh = config.sobel_y_thresholds)
+        mag_binary = gradients.mag_thresh(thresh = config.magnitude_thresholds)
+        s = cv2.cvtColor(image, cv2.COLOR_RGB2HLS)[:,:,2]
+        if s.dtype != np.uint8:
+            s = np.uint8(s*255)
+
+        result = np.zeros_like(gradx)
+        result[((gradx == 1) & (grady == 1)) | (mag_binary == 1) |
+               ((s > config.s_binary_thresholds[0]) & (s <= config.s_binary_thresholds[1]))] = 1
+        return result
 
     def thresh(self, image, thresh_min, thresh_max):
         ret = np.zeros_like(image)
         ret[(image >= thresh_min) & (image <= thresh_max)] = 1
         return ret
+# Threshold strategies, selectable with config.threshold_strategy or the flag
+# --threshold. Every strategy returns the binary image of a RGB image.
+threshold_strategies = {
+    'luv_lab'   : thresholdedImage.luvLabThresholds,    # Luv L OR Lab b (default)
+    'clahe_hsv' : thresholdedImage.prepareThreshold_2,  # CLAHE followed by HSV/RGB thresholds
+    'sobel_s'   : thresholdedImage.gradientThresholds,  # sobel gradients OR HLS s channel
+}
+# Strategies which threshold every pixel on its own (apart from the scaling
+# with the maximum of a channel). The others depend on the neighbourhood of a
+# pixel (sobel kernels, CLAHE tiles), which differs in the gathered corridor
+# of applyThresholdsInCorridor: the bands are side by side and their rows are
+# shifted. These strategies always threshold the full frame.
+per_pixel_strategies = ('luv_lab',)
+
 ## The following functions are only for investigation purposes. This was used for the explorative
 ## to identify the best possible thresholds
 
@@ -139,56 +363,21 @@ test_images_path = 'test_images/*_warped.jpg'
 # Code taken over from Lesson 7 - Gradients and Color Spaces: Applying Sobel
 # Define a function that takes an image, gradient orientation,
 # and threshold min / max values.
+# The thresholds below are calculated with a gradientField. Use a single
+# gradientField directly to apply several thresholds to the same image.
 def abs_sobel_thresh(img, orient='x', sobel_kernel = 3, thresh = (0,255)):
-    # Apply x or y gradient with the OpenCV Sobel() function
-    # and take the absolute value
-    if orient == 'x':
-        abs_sobel = np.absolute(cv2.Sobel(img, cv2.CV_64F, 1, 0, ksize = sobel_kernel))
-    if orient == 'y':
-        abs_sobel = np.absolute(cv2.Sobel(img, cv2.CV_64F, 0, 1, ksize = sobel_kernel))
-    # Rescale back to 8 bit integer
-    scaled_sobel = np.uint8(255*abs_sobel/np.max(abs_sobel))
-    # Create a copy and apply the threshold
-    binary_output = np.zeros_like(scaled_sobel)
-    # Here I'm using inclusive (>=, <=) thresholds, but exclusive is ok too
-    binary_output[(scaled_sobel >= thresh[0]) & (scaled_sobel <= thresh[1])] = 1
-
-    # Return the result
-    return binary_output
+    return gradientField(img, sobel_kernel).abs_sobel_thresh(orient, thresh)
 
 # Code taken over from Lesson 7 - Gradients and Color Spaces: Magnitude of Gradient
 # Define a function to return the magnitude of the gradient
 # for a given sobel kernel size and threshold values
 def mag_thresh(img, sobel_kernel=3, thresh=(0, 255)):
-    # Take both Sobel x and y gradients
-    sobelx = cv2.Sobel(img, cv2.CV_64F, 1, 0, ksize=sobel_kernel)
-    sobely = cv2.Sobel(img, cv2.CV_64F, 0, 1, ksize=sobel_kernel)
-    # Calculate the gradient magnitude
-    gradmag = np.sqrt(sobelx**2 + sobely**2)
-    # Rescale to 8 bit
-    scale_factor = np.max(gradmag)/255
-    gradmag = (gradmag/scale_factor).astype(np.uint8)
-    # Create a binary image of ones where threshold is met, zeros otherwise
-    binary_output = np.zeros_like(gradmag)
-    binary_output[(gradmag >= thresh[0]) & (gradmag <= thresh[1])] = 1
-
-    # Return the binary image
-    return binary_output
+    return gradientField(img, sobel_kernel).mag_thresh(thresh)
 
 # Code taken over from Lesson 7 - Gradients and Color Spaces: Direction of Gradient
 # Define a function to threshold an image for a given range and Sobel kernel for directionsobel
 def dir_threshold(img, sobel_kernel=3, thresh=(0, np.pi/2)):
-    # Calculate the x and y gradients
-    sobelx = cv2.Sobel(img, cv2.CV_64F, 1, 0, ksize=sobel_kernel)
-    sobely = cv2.Sobel(img, cv2.CV_64F, 0, 1, ksize=sobel_kernel)
-    # Take the absolute value of the gradient direction,
-    # apply a threshold, and create a binary image result
-    absgraddir = np.arctan2(np.absolute(sobely), np.absolute(sobelx))
-    binary_output =  np.zeros_like(absgraddir)
-    binary_output[(absgraddir >= thresh[0]) & (absgraddir <= thresh[1])] = 1
-
-    # Return the binary image
-    return binary_output.astype(np.uint8)
+    return gradientField(img, sobel_kernel).dir_threshold(thresh)
 
 # Iterates the warped images in the test_images folder and prints the various
 # outputs from Sobel gradients and S-binary
@@ -212,19 +401,12 @@ def print_gradient_thresholds():
         #read saturation channel
         s = hls[:,:,2].astype(np.uint8)
 
-        gradx = abs_sobel_thresh(gray, orient='x',
-                                 sobel_kernel = config.kernel_size,
-                                 thresh = config.sobel_x_thresholds)
-
-        grady = abs_sobel_thresh(gray, orient = 'y',
-                                 sobel_kernel = config.kernel_size,
-                                 thresh=config.sobel_y_thresholds)
-
-        mag_binary = mag_thresh(gray, sobel_kernel = config.kernel_size,
-                                thresh = config.magnitude_thresholds)
-
-        dir_binary = dir_threshold(gray, sobel_kernel = config.kernel_size,
-                                   thresh = config.direction_thresholds)
+        # the sobel derivatives are calculated once for all gradient thresholds
+        gradients = gradientField(gray, sobel_kernel = config.kernel_size)
+        gradx = gradients.abs_sobel_thresh(orient='x', thresh = config.sobel_x_thresholds)
+        grady = gradients.abs_sobel_thresh(orient = 'y', thresh=config.sobel_y_thresholds)
+        mag_binary = gradients.mag_thresh(thresh = config.magnitude_thresholds)
+        dir_binary = gradients.dir_threshold(thresh = config.direction_thresholds)
 
         s_binary = np.zeros_like(s).astype(np.uint8)
         s_binary[(s > config.s_binary_thresholds[0]) & (s <= config.s_binary_thresholds[1])] = 1
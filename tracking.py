@@ -0,0 +1,131 @@
+# This module predicts the fits of the lane lines from frame to frame, so the
+# search can follow the lines through frames without a valid fit instead of
+# rescanning the whole image.
+# Each line is tracked by a Kalman filter over its polynomial coefficients
+# with a constant velocity model. The coefficients are taken in the scaled
+# form x = A*t^2 + B*t + C with t = y/height, so all components of the state
+# are in pixels. The lane width (distance of the lines at the bottom of the
+# image) is tracked by a scalar Kalman filter. A line without a valid fit is
+# corrected with a pseudo measurement - the fit of the other line shifted by
+# the lane width - with a larger uncertainty.
+import numpy as np
+import config
+
+# standard deviations in px of the scaled coefficients (A, B, C)
+MEASUREMENT_STD = np.array([30., 30., 10.])     # of a fit of the line pixels
+PROCESS_STD = np.array([4., 4., 2.])            # of the change per frame
+PSEUDO_MEASUREMENT_FACTOR = 4.                  # std of the shifted other line / MEASUREMENT_STD
+WIDTH_MEASUREMENT_STD = 15.                     # of a measured lane width
+WIDTH_PROCESS_STD = 2.                          # of the change of the lane width per frame
+
+# Kalman filter of the fit of one line
+class fitFilter:
+    def __init__(self, height=config.IMAGE_HEIGHT):
+        self.height = height
+        # state: A, B, C and their change per frame. None until the first fit.
+        self.x = None
+        self.P = None
+        # constant velocity model
+        self.F = np.eye(6)
+        self.F[:3, 3:] = np.eye(3)
+        self.H = np.hstack((np.eye(3), np.zeros((3, 3))))
+        self.Q = np.diag(np.concatenate((PROCESS_STD**2/4, PROCESS_STD**2)))
+        self.R = np.diag(MEASUREMENT_STD**2)
+
+    def to_coefficients(self, fit):
+        return np.array([fit[0]*self.height**2, fit[1]*self.height, fit[2]])
+
+    def to_fit(self, coefficients):
+        return np.array([coefficients[0]/self.height**2, coefficients[1]/self.height, coefficients[2]])
+
+    # starts the tracking with the given fit (or stops it with None)
+    def reset(self, fit):
+        if fit is None:
+            self.x, self.P = None, None
+        else:
+            self.x = np.concatenate((self.to_coefficients(fit), np.zeros(3)))
+            self.P = np.diag(np.concatenate((MEASUREMENT_STD**2, PROCESS_STD**2)))
+
+    # corrects the state with a fit. 'factor' scales the standard deviation
+    # of the measurement.
+    def update(self, fit, factor=1.):
+        y = self.to_coefficients(fit) - np.dot(self.H, self.x)
+        S = np.dot(np.dot(self.H, self.P), self.H.T) + self.R*factor**2
+        K = np.dot(np.dot(self.P, self.H.T), np.linalg.inv(S))
+        self.x = self.x + np.dot(K, y)
+        self.P = np.dot(np.eye(6) - np.dot(K, self.H), self.P)
+
+    # advances the state by one frame and returns the predicted fit
+    def predict(self):
+        self.x = np.dot(self.F, self.x)
+        self.P = np.dot(np.dot(self.F, self.P), self.F.T) + self.Q
+        return self.to_fit(self.x[:3])
+
+# Tracks both lines of a lane. update() is called once per frame with the
+# accepted fits and prepares the predicted fits, which are searched in the
+# next frame. A line may be missed in up to 'max_missed' consecutive frames
+# before the tracking stops and the lane is rescanned.
+class laneTracker:
+    def __init__(self, max_missed=None, height=config.IMAGE_HEIGHT):
+        self.max_missed = config.max_missed_frames if max_missed is None else max_missed
+        self.height = height
+        self.filters = (fitFilter(height), fitFilter(height))
+        self.width = None
+        self.width_var = None
+        self.missed = [0, 0]
+        self.predicted_fits = (None, None)
+        # frames with a rescan (sliding windows), frames with both lines
+        # found around the prediction, and frames with at least one line
+        # only predicted
+        self.counters = {'rescans': 0, 'tracking': 0, 'predicted': 0}
+
+    # the tracker is disabled with max_missed = 0
+    def enabled(self):
+        return self.max_missed > 0
+
+    # True, if the next frame is searched around the predicted fits
+    def is_tracking(self):
+        return self.enabled() and self.predicted_fits[0] is not None and self.predicted_fits[1] is not None \
+               and max(self.missed) < self.max_missed
+
+    # 'fits' are the accepted fits (left, right) of the current frame, None
+    # for a line without a valid fit. 'rescan' tells if they are the result
+    # of a sliding window search.
+    def update(self, fits, rescan):
+        if rescan:
+            self.counters['rescans'] += 1
+        elif fits[0] is not None and fits[1] is not None:
+            self.counters['tracking'] += 1
+        else:
+            self.counters['predicted'] += 1
+        if not self.enabled():
+            return
+
+        if fits[0] is not None and fits[1] is not None:
+            self.update_width(fits[1][2] - fits[0][2] + (fits[1][0] - fits[0][0])*self.height**2 +
+                              (fits[1][1] - fits[0][1])*self.height)
+        for i, (fit_filter, fit) in enumerate(zip(self.filters, fits)):
+            if rescan or fit_filter.x is None:
+                # start again with the fit of the sliding window search
+                fit_filter.reset(fit)
+                self.missed[i] = 0
+            elif fit is not None:
+                fit_filter.update(fit)
+                self.missed[i] = 0
+            else:
+                self.missed[i] += 1
+                other = fits[1-i]
+                if other is not None and self.width is not None:
+                    # the other line, shifted by the lane width
+                    shift = self.width if i == 1 else -self.width
+                    fit_filter.update(np.array([other[0], other[1], other[2] + shift]), PSEUDO_MEASUREMENT_FACTOR)
+        self.predicted_fits = tuple(None if fit_filter.x is None else fit_filter.predict() for fit_filter in self.filters)
+
+    def update_width(self, width):
+        if self.width is None:
+            self.width, self.width_var = width, WIDTH_MEASUREMENT_STD**2
+            return
+        self.width_var += WIDTH_PROCESS_STD**2
+        gain = self.width_var / (self.width_var + WIDTH_MEASUREMENT_STD**2)
+        self.width += gain*(width - self.width)
+        self.width_var *= 1 - gain
@@ -36,6 +36,76 @@ class perspectiveTransform:
     def unwarp (self, image):
         return cv2.warpPerspective(image, self.Minv, (image.shape[1], image.shape[0]), flags=cv2.INTER_LINEAR)
 
+# Single pass alternative to cameraCalibration.undistort followed by
+# perspectiveTransform.warp. The distortion model of the camera and the
+# homography M are composed into one pair of cv2.remap lookup maps. The maps
+# are built once per resolution and reused for every frame.
+class birdsEyeTransform:
+    def __init__(self, cc, pt):
+        self.cc = cc
+        self.pt = pt
+        # lookup maps cached per resolution (width, height)
+        self.maps = {}
+        # nearest neighbour lookup maps cached per resolution
+        self.nearest_maps = {}
+        # region of interest in the camera image cached per resolution
+        self.rois = {}
+
+    # cv2.initUndistortRectifyMap maps every destination pixel through
+    # inv(newCameraMatrix * R) to normalized camera coordinates, applies the
+    # distortion model and projects the result with the camera matrix.
+    # With R = mtx and newCameraMatrix = M the inverse becomes inv(mtx) * Minv,
+    # i.e. bird's eye pixel -> undistorted pixel -> normalized camera coordinates.
+    # The maps are stored in the fixed point CV_16SC2 form, which is the
+    # fastest form for cv2.remap.
+    def get_maps(self, width, height):
+        if (width, height) not in self.maps:
+            self.maps[(width, height)] = cv2.initUndistortRectifyMap(self.cc.mtx, self.cc.dist,
+                                            self.cc.mtx, self.pt.M, (width, height), cv2.CV_16SC2)
+        return self.maps[(width, height)]
+
+    def warp (self, image):
+        if self.cc.status == True:
+            map1, map2 = self.get_maps(image.shape[1], image.shape[0])
+            return True, cv2.remap(image, map1, map2, interpolation=cv2.INTER_LINEAR)
+        else:
+            return False, None
+
+    # Returns the polygon in the (distorted) camera image which is covered by
+    # the bird's eye view. The src trapezoid alone covers only the columns
+    # between the dest points, so the outline of the lookup maps is used
+    # instead. This keeps the same pixels as the dense warp.
+    def get_roi(self, width, height, step=16):
+        if (width, height) not in self.rois:
+            map1, map2 = self.get_maps(width, height)
+            outline = np.concatenate((map1[0, 0:width:step],                # top edge
+                                      map1[0:height:step, width-1],         # right edge
+                                      map1[height-1, width-1::-step],       # bottom edge
+                                      map1[height-1::-step, 0]))            # left edge
+            self.rois[(width, height)] = outline.astype(np.int32)
+        return self.rois[(width, height)]
+
+    # Nearest neighbour lookup maps of the same transform, cached per
+    # resolution. The coordinates are rounded to the nearest camera pixel.
+    def get_nearest_maps(self, width, height):
+        if (width, height) not in self.nearest_maps:
+            map_x, map_y = cv2.initUndistortRectifyMap(self.cc.mtx, self.cc.dist, self.cc.mtx, self.pt.M,
+                                                       (width, height), cv2.CV_32FC1)
+            self.nearest_maps[(width, height)] = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2, nninterpolation=True)[0]
+        return self.nearest_maps[(width, height)]
+
+    # Transforms a binary image of the (distorted) camera image into the bird's
+    # eye view. Every pixel of the bird's eye view takes the value of the
+    # camera pixel it is mapped from, so a camera pixel covers its whole
+    # footprint in the bird's eye view. The far rows, where one camera pixel
+    # is stretched over many bird's eye pixels, get as many lane pixels as in
+    # the warped camera image.
+    def warp_binary(self, binary):
+        if self.cc.status == False:
+            return False, None
+        nearest_map = self.get_nearest_maps(binary.shape[1], binary.shape[0])
+        return True, cv2.remap(binary, nearest_map, None, interpolation=cv2.INTER_NEAREST)
+
 
 def warp(filename, comp = False):
     image = mpimg.imread(filename)
@@ -0,0 +1,197 @@
+# This module tunes the thresholds of the binary images with a grid search.
+# The test images are transformed to the bird's eye view like in the pipeline
+# (images named *_warped.jpg are used as they are). Their color space channels
+# and gradients are calculated once and cached. A grid of threshold tuples is then evaluated on a
+# process pool against the lane lines fitted with the current thresholds of
+# the pipeline (sliding window search on the 'luv_lab' strategy):
+#  - precision: share of the detected pixels within 'margin' px of the fitted lines
+#  - recall   : share of the rows of the fitted lines with at least one
+#               detected pixel within 'margin' px
+#  - f1       : harmonic mean of precision and recall, used for the ranking
+#  - pixels   : detected pixels per image, the cost of the following lane search
+#  - ms       : time per image to threshold the cached channels
+# The ranked table is written as CSV to the output_images folder.
+# python tuning.py --sweep color
+# python tuning.py --sweep gradient --jobs 8
+import argparse
+import csv
+import glob
+import os
+import time
+import warnings
+import numpy as np
+import cv2
+import matplotlib.image as mpimg
+from itertools import product
+from multiprocessing import Pool
+
+import config
+from thresholds import thresholdedImage, colorThresholds, gradientField
+from lanes import drivingLane
+from transforms import perspectiveTransform, birdsEyeTransform
+from calibrations import cameraCalibration
+
+pickle_file_path = 'camera_cal/camera_distortion_pickle.p'
+output_path = 'output_images/'
+test_images_path = 'test_images/*[0-9].jpg'     # camera images, without *_warped.jpg
+
+# default grids as 'start:stop:step' (stop excluded). The upper limits of
+# the thresholds are kept at the values of the pipeline.
+color_grid = {'l_low': '180:250:5', 'b_low': '140:230:5'}
+gradient_grid = {'sobel_low': '10:60:10', 'mag_low': '20:100:10', 's_low': '90:200:10'}
+
+# channels of the images, cached once per image (see cache_image). Set in every
+# worker of the process pool by init_worker.
+cached_images = []
+# lookup tables of the thresholds
+lookup = colorThresholds()
+
+def parse_range(text):
+    start, stop, step = [int(i) for i in text.split(':')]
+    return list(range(start, stop, step))
+
+# Returns the mask of the pixels within 'margin' px of the given fit
+def line_band(fit, shape, margin):
+    height, width = shape[0], shape[1]
+    band = np.zeros((height, width), dtype=np.uint8)
+    if fit is None:
+        return band
+    ploty = np.arange(height)
+    plotx = np.int32(np.rint(fit[0]*ploty**2 + fit[1]*ploty + fit[2]))
+    for y, x in zip(ploty, plotx):
+        band[y, max(x-margin, 0):max(x+margin+1, 0)] = 1
+    return band
+
+# Calculates all channels used by the grid search of an image and the bands
+# around the lines fitted with the current thresholds of the pipeline
+def cache_image(image, margin):
+    cache = {}
+    cache['l'] = cv2.cvtColor(image, cv2.COLOR_RGB2Luv)[:,:,0].copy()
+    cache['b'] = cv2.cvtColor(image, cv2.COLOR_RGB2Lab)[:,:,2].copy()
+    cache['s'] = cv2.cvtColor(image, cv2.COLOR_RGB2HLS)[:,:,2].copy()
+    gradients = gradientField(cv2.cvtColor(image, cv2.COLOR_RGB2GRAY), sobel_kernel = config.kernel_size)
+    cache['gradx'] = gradients.scaled_abs('x')
+    cache['grady'] = gradients.scaled_abs('y')
+    cache['magnitude'] = gradients.scaled_magnitude()
+    cache['dir_binary'] = gradients.dir_threshold(thresh = config.direction_thresholds)
+
+    # reference lines
+    binary = thresholdedImage(image, colorThresholds())
+    edges, histogram_data = binary.applyThresholds()
+    lane = drivingLane()
+    lane.find_new_fit(edges, histogram_data)
+    cache['bands'] = [line_band(line.recent_fit, image.shape, margin)
+                      for line in (lane.leftline, lane.rightline) if line.recent_fit is not None]
+    cache['band'] = np.zeros(image.shape[:2], dtype=np.uint8)
+    for band in cache['bands']:
+        cv2.bitwise_or(cache['band'], band, dst=cache['band'])
+    return cache
+
+# Returns the bird's eye view (RGB, uint8) of an image file
+def load_warped(name, bet):
+    image = mpimg.imread(name)
+    # the *_warped.jpg files are stored as RGBA float images
+    if image.dtype != np.uint8:
+        image = np.uint8(np.rint(image*255))
+    image = np.ascontiguousarray(image[:,:,:3])
+    if name.endswith('_warped.jpg'):
+        return image
+    return bet.warp(image)[1]
+
+def init_worker(images):
+    global cached_images
+    cached_images = images
+
+# binary image (0/1) of the thresholds (low, high] of a channel, which is
+# scaled with its maximum like in the pipeline
+def channel_thresh(channel, thresh, scale=True):
+    max_value = int(channel.max())
+    factor = 255/max_value if scale and max_value > 0 else 1.
+    return cv2.LUT(channel, lookup.lookup_table(factor, thresh))
+
+def inclusive_thresh(values, thresh):
+    return ((values >= thresh[0]) & (values <= thresh[1])).astype(np.uint8)
+
+# binary image of the Luv L / Lab b thresholds (see colorThresholds)
+def color_binary(cache, params):
+    l_binary = channel_thresh(cache['l'], (params['l_low'], 255))
+    b_binary = channel_thresh(cache['b'], (params['b_low'], 255), scale=cache['b'].max() > 175)
+    return cv2.bitwise_or(l_binary, b_binary)
+
+# binary image of the gradient thresholds (see thresholdedImage.gradientThresholds)
+def gradient_binary(cache, params):
+    sobel_thresh = (params['sobel_low'], config.sobel_x_thresholds[1])
+    gradxy = inclusive_thresh(cache['gradx'], sobel_thresh) & inclusive_thresh(cache['grady'], sobel_thresh)
+    magdir = inclusive_thresh(cache['magnitude'], (params['mag_low'], config.magnitude_thresholds[1])) & cache['dir_binary']
+    s_binary = channel_thresh(cache['s'], (params['s_low'], config.s_binary_thresholds[1]), scale=False)
+    return gradxy | magdir | s_binary
+
+sweeps = {'color': (color_grid, color_binary), 'gradient': (gradient_grid, gradient_binary)}
+
+# Evaluates one threshold tuple on all cached images. Runs in the workers.
+def evaluate(task):
+    sweep, params = task
+    binary_function = sweeps[sweep][1]
+    detected, in_band, covered, rows, elapsed = 0, 0, 0, 0, 0.
+    for cache in cached_images:
+        start = time.perf_counter()
+        binary = binary_function(cache, params)
+        elapsed += time.perf_counter() - start
+        detected += cv2.countNonZero(binary)
+        in_band += cv2.countNonZero(cv2.bitwise_and(binary, cache['band']))
+        for band in cache['bands']:
+            line_rows = band.max(axis=1) > 0
+            covered += np.count_nonzero(cv2.bitwise_and(binary, band).max(axis=1)[line_rows])
+            rows += np.count_nonzero(line_rows)
+    precision = in_band/detected if detected > 0 else 0.
+    recall = covered/rows if rows > 0 else 0.
+    f1 = 2*precision*recall/(precision + recall) if precision + recall > 0 else 0.
+    result = dict(params)
+    result.update({'precision': precision, 'recall': recall, 'f1': f1,
+                   'pixels': detected/len(cached_images), 'ms': elapsed*1000/len(cached_images)})
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Grid search for the thresholds of the binary images')
+    parser.add_argument('--sweep', dest='sweep', choices=list(sweeps), default='color')
+    parser.add_argument('--images', dest='images', default=test_images_path, help='glob pattern of the images')
+    parser.add_argument('--margin', dest='margin', type=int, default=15, help='distance in px to the fitted lines')
+    parser.add_argument('--jobs', dest='jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--top', dest='top', type=int, default=10, help='number of printed rows')
+    for name, default in list(color_grid.items()) + list(gradient_grid.items()):
+        parser.add_argument('--' + name.replace('_', '-'), dest=name, default=default, help='start:stop:step')
+    args = parser.parse_args()
+
+    # the sliding window search may fit lines with very few pixels
+    warnings.filterwarnings('ignore', message='Polyfit may be poorly conditioned')
+    names = sorted(glob.glob(args.images))
+    bet = birdsEyeTransform(cameraCalibration(pickle_file_path), perspectiveTransform())
+    start = time.perf_counter()
+    images = [cache_image(load_warped(name, bet), args.margin) for name in names]
+    print ('cached ' + str(len(images)) + ' images in {:0.1f} s'.format(time.perf_counter() - start))
+
+    grid, binary_function = sweeps[args.sweep]
+    keys = list(grid)
+    tasks = [(args.sweep, dict(zip(keys, values)))
+             for values in product(*[parse_range(getattr(args, key)) for key in keys])]
+    start = time.perf_counter()
+    with Pool(args.jobs, initializer=init_worker, initargs=(images,)) as pool:
+        results = pool.map(evaluate, tasks, chunksize=max(1, len(tasks)//(4*args.jobs)))
+    print ('evaluated ' + str(len(tasks)) + ' threshold tuples in {:0.1f} s'.format(time.perf_counter() - start))
+
+    results.sort(key=lambda result: (-result['f1'], result['pixels']))
+    columns = keys + ['precision', 'recall', 'f1', 'pixels', 'ms']
+    result_file_name = output_path + 'tuning_' + args.sweep + '.csv'
+    with open(result_file_name, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+    print (' '.join('{:>10s}'.format(column) for column in columns))
+    for result in results[:args.top]:
+        print (' '.join('{:>10}'.format(result[column]) if column in keys else '{:>10.3f}'.format(result[column])
+                        for column in columns))
+    print ('Results saved at ' + result_file_name)
+
+if __name__ == '__main__':
+    main()
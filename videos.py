@@ -0,0 +1,266 @@
+# This module executes the pipeline on the frames of videos.
+#
+# Threaded execution (threadedVideo) runs the pipeline in three threads:
+#   decoder -> [queue] -> pipeline -> [queue] -> encoder
+# The queues are bounded, so a fast decoder cannot read ahead more than
+# 'queue_size' frames. There is only one pipeline thread and the queues are
+# FIFO, so the frames are processed (and the state of drivingLane is updated)
+# in order, and written in order. Decoding and encoding (ffmpeg pipes) and
+# most of the processing (OpenCV, NumPy) release the GIL, so the video is
+# processed in about the time of the slowest stage instead of the sum of all
+# stages.
+import os
+import queue
+import subprocess
+import threading
+import time
+import numpy as np
+import cv2
+
+# marks the end of the frames in a queue
+END = None
+
+# busy time and frames of a stage, and the depth of the queue it feeds
+class stageStats:
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.
+        self.depths = []
+
+    def report(self):
+        fps = self.frames/self.busy if self.busy > 0 else 0.
+        text = '{:<10s} frames {:5d}  busy {:7.2f} s  {:7.1f} fps'.format(self.name, self.frames, self.busy, fps)
+        if self.depths:
+            text += '  queue depth mean {:4.1f} max {:3d}'.format(np.mean(self.depths), max(self.depths))
+        return text
+
+# Video I/O backends. Readers return the RGB frames first ... last-1 of a
+# video, writers take RGB frames. moviepy is imported only when it is used.
+#  - moviepy: frames are piped from and to external ffmpeg processes
+#  - opencv : cv2.VideoCapture and cv2.VideoWriter. The frames are read and
+#             converted into preallocated buffers, the conversion between
+#             BGR and RGB is done once at the boundary.
+
+# the results of some output modes (debug, side by side) are float images
+def to_uint8(frame):
+    return frame if frame.dtype == np.uint8 else np.uint8(frame)
+
+class moviepyReader:
+    def __init__(self, file_name, buffers=1):
+        from moviepy.editor import VideoFileClip
+        self.clip = VideoFileClip(file_name)
+        self.fps = self.clip.fps
+        self.frame_count = int(self.clip.duration*self.clip.fps)
+
+    def frames(self, first=0, last=None):
+        last = self.frame_count if last is None else last
+        for i in range(first, last):
+            yield self.clip.get_frame(i/self.fps)
+
+    def close(self):
+        self.clip.close()
+
+# The frames are returned in a ring of 'buffers' preallocated images, so a
+# frame is overwritten when 'buffers' further frames have been read. The
+# pipeline copies its input, so one buffer is enough to process the frames
+# one by one.
+class opencvReader:
+    def __init__(self, file_name, buffers=1):
+        self.capture = cv2.VideoCapture(file_name)
+        if not self.capture.isOpened():
+            raise IOError('cannot open video ' + file_name)
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.bgr = np.empty((height, width, 3), dtype=np.uint8)
+        self.buffers = [np.empty((height, width, 3), dtype=np.uint8) for i in range(buffers)]
+
+    def frames(self, first=0, last=None):
+        last = self.frame_count if last is None else last
+        if first > 0:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+        for i in range(first, last):
+            ret, bgr = self.capture.read(self.bgr)
+            if not ret:
+                break
+            rgb = self.buffers[i % len(self.buffers)]
+            cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=rgb)
+            yield rgb
+
+    def close(self):
+        self.capture.release()
+
+# The writers are opened with the size of the first frame, which depends on
+# the output mode.
+class moviepyWriter:
+    def __init__(self, file_name, fps):
+        self.file_name = file_name
+        self.fps = fps
+        self.writer = None
+
+    def write(self, frame):
+        frame = to_uint8(frame)
+        if self.writer is None:
+            from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+            self.writer = FFMPEG_VideoWriter(self.file_name, (frame.shape[1], frame.shape[0]), self.fps)
+        self.writer.write_frame(frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class opencvWriter:
+    def __init__(self, file_name, fps, fourcc='mp4v'):
+        self.file_name = file_name
+        self.fps = fps
+        self.fourcc = fourcc
+        self.writer = None
+
+    def write(self, frame):
+        frame = to_uint8(frame)
+        if self.writer is None:
+            self.bgr = np.empty_like(frame)
+            self.writer = cv2.VideoWriter(self.file_name, cv2.VideoWriter_fourcc(*self.fourcc), self.fps,
+                                          (frame.shape[1], frame.shape[0]))
+            if not self.writer.isOpened():
+                raise IOError('cannot write video ' + self.file_name)
+        cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=self.bgr)
+        self.writer.write(self.bgr)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+video_readers = {'moviepy': moviepyReader, 'opencv': opencvReader}
+video_writers = {'moviepy': moviepyWriter, 'opencv': opencvWriter}
+
+# Returns the range (first, last+1) of the frames of a reader within the time
+# slot start ... end seconds (the whole video, if start or end is not > 0)
+def frame_range(reader, start, end):
+    if start > 0 and end > 0:
+        return int(round(start*reader.fps)), min(int(round(end*reader.fps)), reader.frame_count)
+    return 0, reader.frame_count
+
+class threadedVideo:
+    def __init__(self, pl, queue_size=8):
+        self.pl = pl
+        self.decoded = queue.Queue(maxsize=queue_size)
+        self.processed = queue.Queue(maxsize=queue_size)
+        self.stats = [stageStats('decode'), stageStats('process'), stageStats('encode')]
+        self.stop = threading.Event()
+        self.errors = []
+
+    # puts an item into a queue, unless another stage has failed
+    def put(self, target, item, stats):
+        while not self.stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                if item is not END:
+                    stats.depths.append(target.qsize())
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, source):
+        while not self.stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return END
+
+    # reads the frames, runs in the decoder thread
+    def decode(self, frames, stats):
+        frames = iter(frames)
+        while True:
+            start = time.perf_counter()
+            frame = next(frames, END)
+            stats.busy += time.perf_counter() - start
+            if frame is END or not self.put(self.decoded, frame, stats):
+                break
+            stats.frames += 1
+
+    # runs the pipeline on the frames in order, runs in the pipeline thread
+    def process(self, stats):
+        while True:
+            frame = self.get(self.decoded)
+            if frame is END:
+                break
+            start = time.perf_counter()
+            result = self.pl(frame)
+            stats.busy += time.perf_counter() - start
+            stats.frames += 1
+            if not self.put(self.processed, result, stats):
+                break
+
+    # writes the results, runs in the encoder thread
+    def encode(self, write, stats):
+        while True:
+            result = self.get(self.processed)
+            if result is END:
+                break
+            start = time.perf_counter()
+            write(result)
+            stats.busy += time.perf_counter() - start
+            stats.frames += 1
+
+    # runs a stage and passes the end (or a failure) to the next stage
+    def run_stage(self, stage, target, *args):
+        try:
+            stage(*args)
+        except Exception as error:
+            self.errors.append(error)
+            self.stop.set()
+        if target is not None:
+            self.put(target, END, args[-1])
+
+    # Processes the frames (iterable of RGB images) with the pipeline and
+    # passes the results to 'write'. Returns the stats of the stages.
+    def run(self, frames, write):
+        decode_stats, process_stats, encode_stats = self.stats
+        threads = [threading.Thread(target=self.run_stage, args=(self.decode, self.decoded, frames, decode_stats)),
+                   threading.Thread(target=self.run_stage, args=(self.process, self.processed, process_stats)),
+                   threading.Thread(target=self.run_stage, args=(self.encode, None, write, encode_stats))]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+        if self.errors:
+            raise self.errors[0]
+        return self.stats
+
+    def report(self):
+        for stats in self.stats:
+            print (stats.report())
+        frames = self.stats[2].frames
+        print ('total      frames {:5d}  wall {:7.2f} s  {:7.1f} fps'.format(frames, self.elapsed, frames/self.elapsed if self.elapsed > 0 else 0.))
+
+# Chunked execution (see main.processVideoChunks) splits the frames of a video
+# into contiguous segments, which are processed by separate processes. Each
+# process runs its own pipeline over a few seconds of frames before its
+# segment (warm up), so the fits of drivingLane are averaged over the same
+# history as in the serial execution when the output starts. The segments are
+# concatenated in order without re-encoding.
+
+# Returns the ranges (first, last+1) of the frame indices of 'jobs' segments
+def split_frames(first, last, jobs):
+    bounds = np.linspace(first, last, jobs + 1).round().astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+# Concatenates the videos (same codec and size) with the concat demuxer of ffmpeg
+def concatenate_videos(file_names, file_name):
+    from moviepy.config import get_setting
+    list_file_name = file_name + '.parts.txt'
+    with open(list_file_name, 'w') as f:
+        for name in file_names:
+            f.write("file '" + os.path.abspath(name) + "'\n")
+    try:
+        subprocess.run([get_setting('FFMPEG_BINARY'), '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                        '-i', list_file_name, '-c', 'copy', file_name], check=True)
+    finally:
+        os.remove(list_file_name)